@@ -0,0 +1,8 @@
+import os
+
+# prometheus_client выбирает многопроцессный режим по этой переменной при
+# импорте. Каталог создает gunicorn в on_starting; процессы без него
+# (manage.py, runserver) считают метрики в памяти и не пишут файлы,
+# которые попали бы в суммы воркеров
+if not os.path.isdir(os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')):
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Histogram, generate_latest,
+                               multiprocess)
+
+LABELS = ('view', 'method', 'status')
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds', 'Время обработки запроса',
+    LABELS,
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+SQL_QUERIES = Histogram(
+    'foodgram_request_sql_queries', 'SQL-запросов за запрос',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+SQL_DURATION = Histogram(
+    'foodgram_request_sql_duration_seconds', 'Время SQL за запрос',
+    LABELS,
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes', 'Размер тела ответа',
+    LABELS,
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+
+class QueryRecorder:
+    """execute_wrapper: считает запросы и суммарное время SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(connection, **kwargs):
+    """Подключает счетчик ко всем соединениям, в любом потоке.
+
+    Под ASGI ORM-код выполняется в пуле потоков со своими соединениями;
+    счетчик текущего запроса приходит туда через ContextVar.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """Собирает метрики запросов по имени URL из resolver_match.
+
+    Запросы, не совпавшие ни с одним URL, попадают под view="unresolved",
+    чтобы произвольные пути не плодили серии. Размер потоковых ответов
+    не известен заранее и не учитывается. Работает и под WSGI, и под
+    ASGI, не переводя асинхронные представления в синхронный режим.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        for connection in connections.all():
+            install_query_recorder(connection)
+        token = current_recorder.set(QueryRecorder())
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self.observe(request, response, started)
+        finally:
+            current_recorder.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = current_recorder.set(QueryRecorder())
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.observe(request, response, started)
+        finally:
+            current_recorder.reset(token)
+        return response
+
+    def observe(self, request, response, started):
+        duration = time.perf_counter() - started
+        recorder = current_recorder.get()
+        match = request.resolver_match
+        labels = (
+            match.view_name if match else 'unresolved',
+            request.method,
+            str(response.status_code),
+        )
+        REQUEST_DURATION.labels(*labels).observe(duration)
+        SQL_QUERIES.labels(*labels).observe(recorder.count)
+        SQL_DURATION.labels(*labels).observe(recorder.duration)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(*labels).observe(len(response.content))
+
+
+def get_registry():
+    # под gunicorn каждый воркер пишет метрики в файлы каталога
+    # PROMETHEUS_MULTIPROC_DIR, а отдаются они суммой по всем воркерам
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path or not os.path.isdir(path):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    return HttpResponse(generate_latest(get_registry()),
+                        content_type=CONTENT_TYPE_LATEST)
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram_api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,7 +48,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram_api.urls'
+# под ASGI избранное, корзина, подписки и поиск ингредиентов
+# обслуживаются асинхронными представлениями
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+ROOT_URLCONF = ('foodgram_api.urls_async' if ASYNC_VIEWS
+                else 'foodgram_api.urls')
 
 TEMPLATES = [
     {
@@ -78,6 +85,22 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # под ASGI запросы к базе идут из пула потоков; без постоянных
+        # соединений каждое обращение открывает новое
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+    }
+}
+
+# Cache
+# Версии справочников и готовые ответы должны быть общими для всех
+# воркеров, поэтому в продакшене укажите общий бэкенд (memcached, файл).
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -123,6 +146,49 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 MEDIA_URL = "/backend_media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "backend_media")
 
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+RELATIONS_CACHE_TIMEOUT = 60 * 60
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+# Индекс похожих рецептов: файлы .npy, общие для всех воркеров
+SIMILAR_INDEX_DIR = os.environ.get(
+    'SIMILAR_INDEX_DIR', os.path.join(BASE_DIR, 'similar_index')
+)
+SIMILAR_RECIPES_LIMIT = 10
+SIMILAR_RECIPES_MAX_LIMIT = 50
+# Ингредиентов в одном запросе подбора по продуктам
+PANTRY_MAX_INGREDIENTS = 100
+
+# Период полураспада веса добавления в избранное или корзину, секунды;
+# после изменения нужен update_trending --rebuild
+TRENDING_HALF_LIFE = 3 * 24 * 60 * 60
+# Свежие события учитываются со следующего запуска update_trending
+TRENDING_LAG = 60
+
+# Лента рецептов от авторов из подписок
+FEED_FANOUT_LIMIT = 10000
+FEED_BACKFILL_RECIPES = 100
+FEED_BATCH_SIZE = 1000
+FEED_MAX_LIMIT = 50
+
+# Рецептов в одной транзакции массового импорта
+RECIPE_BULK_BATCH_SIZE = 500
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 8000
+
+# Наибольшие размеры уменьшенных копий картинок рецептов
+RECIPE_IMAGE_SIZES = {
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+
+SHOPPING_LIST_PDF_FONT = os.environ.get(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -133,7 +199,8 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
+        'users.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -144,6 +211,18 @@ REST_FRAMEWORK = {
 
 }
 
+# Сколько секунд токен помнит пользователя без запроса к базе
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+# access-токен проверяется без базы, поэтому выход, смена пароля
+# и блокировка действуют на него только после ACCESS_TOKEN_LIFETIME;
+# refresh-токен после них сразу отклоняется (UserTokenRefreshSerializer)
+SIMPLE_JWT = {
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'SERIALIZERS': {
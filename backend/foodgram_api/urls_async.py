@@ -0,0 +1,18 @@
+from django.urls import path
+from recipes import async_views as recipes_views
+from users import async_views as users_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+# асинхронные версии частых коротких запросов; имена URL совпадают
+# с синхронными, поэтому reverse() и метрики не зависят от режима
+urlpatterns = [
+    path('api/recipes/<int:recipe_id>/favorite/', recipes_views.favorite,
+         name='recipes-favorite'),
+    path('api/recipes/<int:recipe_id>/shopping_cart/',
+         recipes_views.shopping_cart, name='shopping_cart'),
+    path('api/ingredients/', recipes_views.ingredients,
+         name='ingredients-list'),
+    path('api/users/<int:id>/subscribe/', users_views.subscribe,
+         name='customuser-subscribe'),
+] + sync_urlpatterns
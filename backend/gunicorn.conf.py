@@ -0,0 +1,39 @@
+import os
+import shutil
+
+# метрики воркеров пишутся в общий каталог только под gunicorn; manage.py
+# и runserver без этой переменной считают их в памяти процесса
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+# SERVER_MODE=asgi запускает воркеры uvicorn с асинхронными представлениями
+if os.environ.get('SERVER_MODE') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'foodgram_api.asgi:application'
+else:
+    wsgi_app = 'foodgram_api.wsgi:application'
+
+
+def on_starting(server):
+    # метрики прошлого запуска не должны попасть в суммы
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def post_worker_init(worker):
+    # индексы строятся до первого запроса, а не внутри него
+    from django.db import DatabaseError, connections
+    from recipes.ingredient_index import ingredient_index
+    from recipes.similarity import similar_index
+    try:
+        ingredient_index.build()
+        similar_index.get()
+    except DatabaseError:
+        worker.log.exception('Индексы будут построены позже')
+    finally:
+        connections.close_all()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -3,6 +3,8 @@ from import_export.admin import ImportMixin
 
 from .models import Favorites, Ingredient, IngredientForRecipe, Recipe, Tag
 from .resources import IngredientResource
+from .similarity import schedule_similar_update
+from .tag_masks import tags_mask
 
 
 class FavoriteAdmin(admin.ModelAdmin):
@@ -14,9 +16,18 @@ class IngredientForRecipeAdmin(admin.ModelAdmin):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'author', 'name',)
+    list_display = ('id', 'author', 'name', 'favorites_count',
+                    'in_carts_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     list_filter = ('author', 'name', 'tags')
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recipe = form.instance
+        recipe.tags_mask = tags_mask(recipe.tags.all())
+        recipe.save(update_fields=['tags_mask'])
+        schedule_similar_update([recipe.id])
+
 
 class IngredientAdmin(ImportMixin, admin.ModelAdmin):
     list_filter = ('id', 'name', 'measurement_unit',)
@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from foodgram_api.async_api import async_api_view, in_thread
+from rest_framework import status
+from rest_framework.response import Response
+from users.serializers import RecipeSubscriptionSerializer
+
+from .ingredient_index import ingredient_index
+from .models import Recipe
+from .toggles import (add_favorite, add_to_cart, remove_favorite,
+                      remove_from_cart)
+from .views import IngredientViewSet
+
+ingredient_view = IngredientViewSet.as_view({'get': 'list', 'post': 'create'})
+
+
+@async_api_view(['GET', 'DELETE'])
+async def favorite(request, recipe_id):
+    if request.method == 'GET':
+        recipe = await in_thread(get_object_or_404, Recipe, id=recipe_id)
+        await in_thread(add_favorite, request.user, recipe)
+        serializer = RecipeSubscriptionSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    favorite = await in_thread(remove_favorite, request.user, recipe_id)
+    return Response(
+        data={
+            'message': f'Рецепт {favorite.recipe} удален из избранного у '
+                       f'пользователя {request.user}'},
+        status=status.HTTP_204_NO_CONTENT
+    )
+
+
+@async_api_view(['GET', 'DELETE'])
+async def shopping_cart(request, recipe_id):
+    if request.method == 'GET':
+        recipe = await in_thread(get_object_or_404, Recipe, id=recipe_id)
+        await in_thread(add_to_cart, request.user, recipe)
+        serializer = RecipeSubscriptionSerializer(recipe)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    cart = await in_thread(remove_from_cart, request.user, recipe_id)
+    return Response(
+        data={
+            'message': f'Рецепт {cart.recipe} удален из корзины у '
+                       f'пользователя {request.user}'},
+        status=status.HTTP_204_NO_CONTENT
+    )
+
+
+@async_api_view(['GET'], authenticated=False)
+async def search_ingredients(request):
+    return Response(await in_thread(
+        ingredient_index.search, request.GET['name'],
+        settings.INGREDIENT_SEARCH_LIMIT
+    ))
+
+
+async def ingredients(request):
+    """Поиск по названию асинхронно, остальное - обычным IngredientViewSet."""
+    if (request.method == 'GET' and request.GET.get('name')
+            and 'measurement_unit' not in request.GET):
+        return await search_ingredients(request)
+    return await sync_to_async(ingredient_view)(request)
@@ -0,0 +1,242 @@
+import math
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import count
+from urllib.parse import urlencode
+
+import requests
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from foodgram_api.metrics import QueryRecorder
+from rest_framework.authtoken.models import Token
+
+from .ingredient_index import ingredient_index
+from .models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+def percentile(values, fraction):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def describe_data():
+    return {
+        'vendor': connection.vendor,
+        'users': User.objects.count(),
+        'recipes': Recipe.objects.count(),
+    }
+
+
+def get_scenarios():
+    """Сценарии: имя -> (путь, параметры, нужна ли авторизация).
+
+    Пользователь, автор и рецепт выбираются детерминированно, чтобы на
+    одних и тех же данных замеры повторялись.
+    """
+    user = User.objects.annotate(
+        cart_size=Count('purchases')
+    ).order_by('-cart_size', 'id').first()
+    author = User.objects.order_by('-recipes_count', 'id').first()
+    recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+    tags = list(Tag.objects.order_by('id').values_list('slug', flat=True))
+    ingredient = Ingredient.objects.order_by('id').first()
+    recipes_url = reverse('recipes-list')
+    return user, {
+        'recipes-list': (recipes_url, {}, False),
+        'recipes-list-page-10': (recipes_url, {'page': 10}, False),
+        'recipes-list-tags': (recipes_url, {'tags': tags[:2]}, False),
+        'recipes-list-author': (recipes_url, {'author': author.id}, False),
+        'recipes-list-search': (
+            recipes_url, {'search': recipe.name.split()[0]}, False
+        ),
+        'recipes-list-favorited': (
+            recipes_url, {'is_favorited': 'true'}, True
+        ),
+        'recipes-list-cursor': (
+            recipes_url, {'pagination': 'cursor'}, False
+        ),
+        'recipes-list-trending': (
+            recipes_url, {'ordering': 'trending'}, False
+        ),
+        'recipes-detail': (
+            reverse('recipes-detail', args=[recipe.id]), {}, True
+        ),
+        'recipes-feed': (reverse('recipes-feed'), {}, True),
+        'recipes-similar': (
+            reverse('recipes-similar', args=[recipe.id]), {}, False
+        ),
+        'download-shopping-cart': (
+            reverse('download_shopping_cart'), {}, True
+        ),
+        'users-subscriptions': (
+            reverse('customuser-subscriptions'), {'recipes_limit': 3}, True
+        ),
+        'ingredients-search': (
+            reverse('ingredients-list'), {'name': ingredient.name[:3]},
+            False
+        ),
+    }
+
+
+def measure(client, path, params):
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(recorder))
+        started = time.perf_counter()
+        response = client.get(path, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f'{path}: ответ {response.status_code}')
+    return elapsed, recorder.count
+
+
+def run_benchmark(iterations, warmup):
+    """Прогоняет сценарии через тестовый клиент: p50, p95 и число SQL."""
+    user, scenarios = get_scenarios()
+    # воркер gunicorn строит индекс ингредиентов при старте
+    ingredient_index.build()
+    token, _ = Token.objects.get_or_create(user=user)
+    clients = {
+        False: Client(),
+        True: Client(HTTP_AUTHORIZATION=f'Token {token.key}'),
+    }
+    results = {}
+    for name, (path, params, authenticated) in scenarios.items():
+        client = clients[authenticated]
+        for _ in range(warmup):
+            measure(client, path, params)
+        timings, queries = [], []
+        for _ in range(iterations):
+            elapsed, count = measure(client, path, params)
+            timings.append(elapsed * 1000)
+            queries.append(count)
+        results[name] = {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': statistics.median_high(queries),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно базовой линии: больше SQL или медленнее p95."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL-запросов {base["queries"]} -> '
+                f'{current["queries"]}'
+            )
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {base["p95_ms"]} мс -> {current["p95_ms"]} мс'
+            )
+    return regressions
+
+
+def get_load_users(size, prefix):
+    """Отдельные пользователи без избранного, корзины и подписок.
+
+    Нагрузка добавляет и тут же убирает связи, поэтому на своих
+    пользователях она не трогает данные, созданные seed_scale.
+    """
+    tokens = []
+    for number in range(size):
+        user, _ = User.objects.get_or_create(
+            username=f'{prefix}{number}',
+            defaults={'email': f'{prefix}{number}@example.com'},
+        )
+        token, _ = Token.objects.get_or_create(user=user)
+        tokens.append(token.key)
+    return tokens
+
+
+def get_toggle_requests(recipe_id, author_id, ingredient):
+    """Один круг виртуального пользователя: сценарий, метод, путь."""
+    favorite = reverse('recipes-favorite', args=[recipe_id])
+    cart = reverse('shopping_cart', args=[recipe_id])
+    subscribe = reverse('customuser-subscribe', args=[author_id])
+    search = reverse('ingredients-list') + '?' + urlencode(
+        {'name': ingredient[:3]}
+    )
+    return [
+        ('favorite', 'GET', favorite), ('favorite', 'DELETE', favorite),
+        ('shopping-cart', 'GET', cart), ('shopping-cart', 'DELETE', cart),
+        ('subscribe', 'GET', subscribe), ('subscribe', 'DELETE', subscribe),
+        ('ingredients-search', 'GET', search),
+    ]
+
+
+def run_load(base_url, concurrency, rounds, prefix='loadtest'):
+    """Нагружает запущенный сервер короткими запросами-переключателями.
+
+    Каждый поток работает от своего пользователя и по кругу добавляет
+    и убирает рецепт в избранном и корзине, подписывается на автора
+    и ищет ингредиент. Возвращает пропускную способность, p50 и p95
+    по сценариям и число ответов с ошибкой.
+    """
+    recipes = list(Recipe.objects.order_by('id').values_list(
+        'id', 'author_id'
+    )[:1000])
+    names = list(Ingredient.objects.order_by('id').values_list(
+        'name', flat=True
+    )[:1000])
+    tokens = get_load_users(concurrency, prefix)
+    rounds_counter = count()
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def worker(token):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Token {token}'
+        while True:
+            number = next(rounds_counter)
+            if number >= rounds:
+                return
+            recipe_id, author_id = recipes[number % len(recipes)]
+            for name, method, path in get_toggle_requests(
+                recipe_id, author_id, names[number % len(names)]
+            ):
+                started = time.perf_counter()
+                response = session.request(method, base_url + path)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    timings[name].append(elapsed * 1000)
+                    if response.status_code >= 400:
+                        errors[name] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, tokens))
+    elapsed = time.perf_counter() - started
+    total = sum(len(values) for values in timings.values())
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'rps': round(total / elapsed, 1),
+        'scenarios': {
+            name: {
+                'p50_ms': round(percentile(values, 0.5), 2),
+                'p95_ms': round(percentile(values, 0.95), 2),
+                'errors': errors[name],
+            }
+            for name, values in timings.items()
+        },
+    }
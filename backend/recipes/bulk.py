@@ -0,0 +1,148 @@
+from itertools import islice
+
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from .counters import change_counter
+from .feed import fan_out
+from .fields import RecipeImageField
+from .images import store_recipe_image
+from .models import Ingredient, IngredientForRecipe, Recipe, Tag
+from .similarity import schedule_similar_update
+from .tag_masks import tags_mask
+
+ERRORS = {
+    'duplicate_recipe': 'Рецепт с таким названием уже существует',
+    'duplicate_ingredients': 'Такой ингредиент уже существует',
+    'unknown_ingredients': 'Ингредиенты не найдены: {ids}',
+    'unknown_tags': 'Теги не найдены: {ids}',
+}
+
+
+class BulkIngredientSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class BulkRecipeSerializer(serializers.ModelSerializer):
+    """Рецепт для массового импорта; проверка полей не обращается к базе."""
+    tags = serializers.ListField(child=serializers.IntegerField(),
+                                 allow_empty=False)
+    ingredients = BulkIngredientSerializer(many=True, allow_empty=False)
+    image = RecipeImageField(max_length=None)
+
+    class Meta:
+        model = Recipe
+        fields = ['name', 'text', 'cooking_time', 'image', 'tags',
+                  'ingredients']
+
+
+def batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def validate_batch(batch, offset):
+    """Проверяет пачку рецептов; все связи ищутся одним запросом на тип."""
+    valid, errors = [], []
+    for index, item in enumerate(batch, offset):
+        serializer = BulkRecipeSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    ingredient_ids = {
+        ingredient['id']
+        for _, data in valid for ingredient in data['ingredients']
+    }
+    tag_ids = {tag for _, data in valid for tag in data['tags']}
+    ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+    tags = Tag.objects.in_bulk(tag_ids)
+    taken = set(Recipe.objects.filter(
+        name__in=[data['name'] for _, data in valid]
+    ).values_list('name', flat=True))
+    checked = []
+    for index, data in valid:
+        item_errors = {}
+        if data['name'] in taken:
+            item_errors['name'] = [ERRORS['duplicate_recipe']]
+        taken.add(data['name'])
+        ids = [ingredient['id'] for ingredient in data['ingredients']]
+        missing = sorted(set(ids) - ingredients.keys())
+        if missing:
+            item_errors['ingredients'] = [
+                ERRORS['unknown_ingredients'].format(ids=missing)
+            ]
+        elif len(set(ids)) != len(ids):
+            item_errors['ingredients'] = [ERRORS['duplicate_ingredients']]
+        missing = sorted(set(data['tags']) - tags.keys())
+        if missing:
+            item_errors['tags'] = [ERRORS['unknown_tags'].format(ids=missing)]
+        if item_errors:
+            errors.append({'index': index, 'errors': item_errors})
+        else:
+            data['tags'] = [tags[tag] for tag in set(data['tags'])]
+            checked.append(data)
+    return checked, errors
+
+
+def create_recipes(recipes):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Recipe.objects.bulk_create(recipes)
+    # без RETURNING id новых строк неизвестны, поэтому по одной вставке
+    for recipe in recipes:
+        recipe.save(force_insert=True)
+    return recipes
+
+
+@transaction.atomic
+def write_batch(author, batch):
+    recipes = create_recipes([
+        Recipe(
+            author=author, name=data['name'], text=data['text'],
+            cooking_time=data['cooking_time'],
+            image=store_recipe_image(data['image']),
+            tags_mask=tags_mask(data['tags']),
+        )
+        for data in batch
+    ])
+    tags_through = Recipe.tags.through
+    tags_through.objects.bulk_create([
+        tags_through(recipe_id=recipe.id, tag_id=tag.id)
+        for recipe, data in zip(recipes, batch)
+        for tag in data['tags']
+    ])
+    IngredientForRecipe.objects.bulk_create([
+        IngredientForRecipe(
+            recipe_id=recipe.id, ingredient_id=ingredient['id'],
+            amount=ingredient['amount'],
+        )
+        for recipe, data in zip(recipes, batch)
+        for ingredient in data['ingredients']
+    ])
+    change_counter(author, 'recipes_count', len(recipes))
+    fan_out(author, recipes)
+    schedule_similar_update(recipe.id for recipe in recipes)
+    return [recipe.id for recipe in recipes]
+
+
+def import_recipes(author, items, batch_size):
+    """Импортирует рецепты пачками, каждая пачка — одна транзакция.
+
+    Рецепты с ошибками пропускаются и попадают в errors с номером
+    в исходной последовательности, остальные сохраняются.
+    """
+    created, errors = [], []
+    offset = 0
+    for batch in batches(items, batch_size):
+        checked, batch_errors = validate_batch(batch, offset)
+        if checked:
+            created.extend(write_batch(author, checked))
+        errors.extend(batch_errors)
+        offset += len(batch)
+    errors.sort(key=lambda error: error['index'])
+    return {'created': created, 'errors': errors}
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+
+def get_version(namespace):
+    return cache.get_or_set(f'version:{namespace}', 0, None)
+
+
+def bump_version(namespace):
+    """Делает недействительными все закешированные данные namespace."""
+    try:
+        cache.incr(f'version:{namespace}')
+    except ValueError:
+        cache.set(f'version:{namespace}', 1, None)
+
+
+GZIP_CODING = re.compile(r'\bgzip\b')
+QUALITY = re.compile(r'^\s*q\s*=\s*([0-9.]+)\s*$', re.IGNORECASE)
+
+
+def accepts_gzip(accept_encoding):
+    """Разрешает ли заголовок Accept-Encoding ответ в gzip.
+
+    Кодировки разбираются вместе с q-значениями: q=0 означает отказ,
+    "*" разрешает gzip, если он не указан явно.
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *params = coding.split(';')
+        quality = 1.0
+        for param in params:
+            match = QUALITY.match(param)
+            if match:
+                try:
+                    quality = float(match.group(1))
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    for name, quality in qualities.items():
+        if GZIP_CODING.search(name):
+            return quality > 0
+    return qualities.get('*', 0) > 0
+
+
+class CachedResponseMixin:
+    """Кеширует готовые JSON-ответы list/retrieve справочников.
+
+    Ответ хранится уже отрендеренным и сжатым gzip, ключ включает версию
+    namespace, которую увеличивают сигналы при изменении данных, поэтому
+    попадание в кеш не обращается к базе. Ответы отдаются с сильным
+    ETag и на совпадающий If-None-Match возвращают 304. В ключ входят
+    только параметры из cache_query_params, чтобы произвольные строки
+    запроса не плодили записи в кеше.
+    """
+    cache_namespace = None
+    cache_query_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+    def get_cache_key(self, request):
+        params = urlencode(sorted(
+            (name, value) for name in self.cache_query_params
+            for value in request.query_params.getlist(name)
+        ))
+        return (f'response:{self.cache_namespace}:'
+                f'{get_version(self.cache_namespace)}:'
+                f'{request.path}?{params}')
+
+    def cached_response(self, request, get_response):
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            response = get_response()
+            if response.status_code != 200:
+                return response
+            body = JSONRenderer().render(response.data)
+            entry = {
+                'etag': f'"{hashlib.sha256(body).hexdigest()}"',
+                'body': body,
+                'gzip': gzip.compress(body),
+            }
+            cache.set(key, entry, settings.REFERENCE_CACHE_TIMEOUT)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (
+            entry['etag'] in parse_etags(if_none_match)
+            or if_none_match.strip() == '*'
+        ):
+            response = HttpResponseNotModified()
+        elif accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            response = HttpResponse(entry['gzip'],
+                                    content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(entry['body'],
+                                    content_type='application/json')
+        response['ETag'] = entry['etag']
+        response['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from users.models import Follow
+
+from .models import Favorites, Purchase, Recipe
+
+User = get_user_model()
+
+# (модель со счетчиком, поле счетчика, считаемая модель, ссылка на модель)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorites, 'recipe'),
+    (Recipe, 'in_carts_count', Purchase, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change_counter(instance, field, delta):
+    """Атомарно меняет счетчик в базе через F(), без гонки чтения.
+
+    Счетчик не опускается ниже нуля, даже если он уже разошелся
+    с данными; расхождения исправляет команда reconcile_counters.
+    """
+    type(instance).objects.filter(pk=instance.pk).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def count_related(model, field):
+    """Подзапрос: число строк model, ссылающихся на внешнюю строку."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
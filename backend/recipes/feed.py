@@ -0,0 +1,127 @@
+import base64
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from users.models import Follow
+
+from .models import FeedEntry, Recipe
+
+User = get_user_model()
+
+
+def write_entries(entries):
+    FeedEntry.objects.bulk_create(entries, batch_size=settings.FEED_BATCH_SIZE,
+                                  ignore_conflicts=True)
+
+
+def fan_out(author, recipes):
+    """Записывает новые рецепты автора в ленты его подписчиков.
+
+    Записи вставляются пачками по FEED_BATCH_SIZE. Если подписчиков
+    больше FEED_FANOUT_LIMIT, рассылка выключается: одна публикация
+    не должна превращаться в миллионы строк, а ленты берут рецепты
+    такого автора при чтении.
+    """
+    # request.user может быть собран из JWT без этих полей
+    feed_fanout, followers_count = User.objects.filter(
+        pk=author.pk
+    ).values_list('feed_fanout', 'followers_count').get()
+    if not feed_fanout:
+        return
+    if followers_count > settings.FEED_FANOUT_LIMIT:
+        User.objects.filter(pk=author.pk).update(feed_fanout=False)
+        return
+    followers = Follow.objects.filter(author=author).values_list(
+        'user_id', flat=True
+    )
+    batch = []
+    for user_id in followers.iterator():
+        batch.extend(
+            FeedEntry(user_id=user_id, author_id=author.id, recipe=recipe,
+                      pub_date=recipe.pub_date)
+            for recipe in recipes
+        )
+        if len(batch) >= settings.FEED_BATCH_SIZE:
+            write_entries(batch)
+            batch = []
+    write_entries(batch)
+
+
+def backfill(user, author):
+    """После подписки добавляет в ленту последние рецепты автора."""
+    if not author.feed_fanout:
+        return
+    write_entries(
+        FeedEntry(user_id=user.id, author_id=author.id, recipe_id=recipe_id,
+                  pub_date=pub_date)
+        for recipe_id, pub_date in Recipe.objects.filter(
+            author=author
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'pub_date'
+        )[:settings.FEED_BACKFILL_RECIPES]
+    )
+
+
+def trim(user, author):
+    """После отписки убирает рецепты автора из ленты."""
+    FeedEntry.objects.filter(user=user, author=author).delete()
+
+
+def before(date_field, id_field, position):
+    pub_date, recipe_id = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(
+        **{date_field: pub_date, f'{id_field}__lt': recipe_id}
+    )
+
+
+def get_feed(user, limit, position=None):
+    """[(дата публикации, id рецепта)] ленты, от новых к старым.
+
+    Возвращает до limit + 1 рецептов, лишний показывает, что есть
+    следующая страница. position - последний рецепт предыдущей
+    страницы. Рецепты авторов без рассылки берутся из Recipe по индексу
+    (author, -pub_date, -id) и сливаются с записями ленты.
+    """
+    merged_authors = list(Follow.objects.filter(
+        user=user, author__feed_fanout=False
+    ).values_list('author_id', flat=True))
+    entries = FeedEntry.objects.filter(user=user)
+    recipes = Recipe.objects.filter(author__in=merged_authors)
+    if merged_authors:
+        entries = entries.exclude(author__in=merged_authors)
+    if position is not None:
+        entries = entries.filter(before('pub_date', 'recipe_id', position))
+        recipes = recipes.filter(before('pub_date', 'id', position))
+    streams = [entries.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:limit + 1]]
+    if merged_authors:
+        streams.append(recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:limit + 1])
+    return list(islice(heapq.merge(*streams, reverse=True), limit + 1))
+
+
+def encode_position(position):
+    pub_date, recipe_id = position
+    return base64.urlsafe_b64encode(
+        f'{pub_date.isoformat()} {recipe_id}'.encode()
+    ).decode()
+
+
+def decode_position(cursor):
+    """Позиция из параметра cursor или None, если он испорчен."""
+    try:
+        pub_date, recipe_id = base64.urlsafe_b64decode(
+            cursor.encode()
+        ).decode().split(' ')
+        pub_date, recipe_id = parse_datetime(pub_date), int(recipe_id)
+    except (ValueError, UnicodeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, recipe_id
@@ -0,0 +1,46 @@
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+from .images import get_derivative_urls
+from .uploads import check_dimensions, check_size
+
+
+class RecipeImageField(Base64ImageField):
+    """Картинка рецепта: строка base64 или файл из multipart/form-data.
+
+    Для проверки размеров Pillow читает только заголовок файла, не
+    раскодируя картинку целиком.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            image = serializers.ImageField.to_internal_value(self, data)
+        else:
+            image = super().to_internal_value(data)
+        if image is None:
+            return image
+        check_size(image.size)
+        image.seek(0)
+        with Image.open(image) as source:
+            check_dimensions(*source.size)
+        image.seek(0)
+        return image
+
+
+class ImageDerivativesField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии картинки рецепта."""
+
+    def to_representation(self, value):
+        urls = get_derivative_urls(value.name)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {
+            size: {
+                image_format: request.build_absolute_uri(url)
+                for image_format, url in formats.items()
+            }
+            for size, formats in urls.items()
+        }
@@ -1,6 +1,15 @@
 import django_filters as filters
+from django import forms
+from django.db.models import F
+from django_filters.widgets import QueryArrayWidget
 
 from .models import Ingredient, Recipe
+from .search import search_recipes
+from .tag_masks import match_mask
+from .trending import TRENDING_ORDERING
+
+TAGS_MATCH = (('any', 'Любой из тегов'), ('all', 'Все теги'))
+ORDERINGS = (('trending', 'Популярные сейчас'),)
 
 
 class IngredientNameFilter(filters.FilterSet):
@@ -11,9 +20,53 @@ class IngredientNameFilter(filters.FilterSet):
         fields = ('name', 'measurement_unit')
 
 
+class SlugListField(forms.Field):
+    widget = QueryArrayWidget
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class SlugListFilter(filters.Filter):
+    field_class = SlugListField
+
+
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    """Теги фильтруются по маске Recipe.tags_mask, без JOIN и DISTINCT.
+
+    tags_match=any (по умолчанию) оставляет рецепты хотя бы с одним
+    из тегов, tags_match=all - только со всеми. Неизвестные слаги ничему
+    не соответствуют.
+    """
+    tags = SlugListFilter(method='filter_tags')
+    tags_match = filters.ChoiceFilter(choices=TAGS_MATCH,
+                                      method='filter_tags_match')
+    search = filters.CharFilter(method='filter_search')
+    # объявлен последним, чтобы порядок заменял сортировку поиска
+    ordering = filters.ChoiceFilter(choices=ORDERINGS,
+                                    method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags')
+        fields = ('author', 'tags', 'tags_match', 'search', 'ordering')
+
+    def filter_tags(self, queryset, name, value):
+        match_all = self.form.cleaned_data.get('tags_match') == 'all'
+        mask = match_mask(value, match_all)
+        if mask is None:
+            return queryset.none()
+        queryset = queryset.alias(tag_bits=F('tags_mask').bitand(mask))
+        if match_all:
+            return queryset.filter(tag_bits=mask)
+        return queryset.exclude(tag_bits=0)
+
+    def filter_tags_match(self, queryset, name, value):
+        # учитывается в filter_tags
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        # по индексу recipe_trending_idx; ключи обновляет update_trending
+        return queryset.order_by(*TRENDING_ORDERING)
@@ -0,0 +1,115 @@
+import hashlib
+import io
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+IMAGES_ROOT = 'recipes'
+HASHED_NAME = re.compile(
+    rf'^{IMAGES_ROOT}/[0-9a-f]{{2}}/(?P<hash>[0-9a-f]{{64}})/original\.\w+$'
+)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def image_directory(content_hash):
+    return f'{IMAGES_ROOT}/{content_hash[:2]}/{content_hash}'
+
+
+def derivative_name(original_name, size, image_format):
+    directory = posixpath.dirname(original_name)
+    return f'{directory}/{size}.{EXTENSIONS[image_format]}'
+
+
+def is_hashed_name(name):
+    return bool(name and HASHED_NAME.match(name))
+
+
+def to_rgb(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_derivative(image, max_size, image_format):
+    derivative = image.copy()
+    derivative.thumbnail(max_size, Image.LANCZOS)
+    pil_format, options = FORMATS[image_format]
+    buffer = io.BytesIO()
+    derivative.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def save_once(name, content):
+    """Сохраняет файл ровно под именем name.
+
+    Если файл с таким именем успел записать параллельный запрос,
+    хранилище сохранило бы копию под другим именем; копия удаляется,
+    а по хешу в имени содержимое у них одинаковое.
+    """
+    saved = default_storage.save(name, content)
+    if saved != name:
+        default_storage.delete(saved)
+    return name
+
+
+def store_recipe_image(file):
+    """Сохраняет картинку рецепта по хешу содержимого и делает превью.
+
+    Файлы кладутся в recipes/<xx>/<sha256>/: оригинал и уменьшенные
+    копии из RECIPE_IMAGE_SIZES в WebP и JPEG. Повторная загрузка той же
+    картинки ничего не пишет и возвращает уже сохраненное имя. Файл
+    читается по частям, целиком в памяти он не держится.
+    """
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    content_hash = hasher.hexdigest()
+    file.seek(0)
+    with Image.open(file) as source:
+        extension = (source.format or 'png').lower().replace('jpeg', 'jpg')
+        name = f'{image_directory(content_hash)}/original.{extension}'
+        if default_storage.exists(name):
+            return name
+        image = to_rgb(ImageOps.exif_transpose(source))
+    for size, max_size in settings.RECIPE_IMAGE_SIZES.items():
+        for image_format in FORMATS:
+            target = derivative_name(name, size, image_format)
+            if not default_storage.exists(target):
+                save_once(
+                    target, render_derivative(image, max_size, image_format)
+                )
+    # оригинал пишется последним: его наличие означает готовые превью
+    file.seek(0)
+    return save_once(name, file)
+
+
+def get_derivative_urls(name):
+    """URL превью по размерам и форматам; для старых картинок — оригинал."""
+    if not name:
+        return None
+    if not is_hashed_name(name):
+        url = default_storage.url(name)
+        return {
+            size: {image_format: url for image_format in FORMATS}
+            for size in settings.RECIPE_IMAGE_SIZES
+        }
+    return {
+        size: {
+            image_format: default_storage.url(
+                derivative_name(name, size, image_format)
+            )
+            for image_format in FORMATS
+        }
+        for size in settings.RECIPE_IMAGE_SIZES
+    }
@@ -0,0 +1,83 @@
+import threading
+from bisect import bisect_left
+from functools import partial
+
+from django.db import connections, transaction
+
+from .caching import bump_version, get_version
+from .models import Ingredient
+
+PREFIX_END = '\U0010ffff'
+
+
+class IngredientIndex:
+    """Отсортированный по названию список ингредиентов в памяти процесса.
+
+    Поиск по префиксу — два bisect по списку ключей в нижнем регистре,
+    поэтому не зависит от размера справочника. Воркер gunicorn строит
+    индекс при старте (post_worker_init). Версия индекса хранится в кеше:
+    заметив новую версию, процесс перестраивает индекс в фоновом потоке
+    и до подмены продолжает отвечать по старому.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = None
+        self._rebuilding = False
+
+    def invalidate(self):
+        # до фиксации транзакции другой процесс прочитал бы по новой
+        # версии старые строки
+        transaction.on_commit(partial(bump_version, 'ingredients'))
+
+    def build(self):
+        version = get_version('ingredients')
+        entries = sorted(
+            (name.casefold(), unit.casefold(), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.order_by(
+            ).values_list('id', 'name', 'measurement_unit').iterator()
+        )
+        # кортеж подменяется одним присваиванием, поиск видит либо
+        # старый индекс, либо новый целиком
+        self._index = (
+            [entry[0] for entry in entries],
+            [{'id': pk, 'name': name, 'measurement_unit': unit}
+             for _, _, pk, name, unit in entries],
+        )
+        self._version = version
+
+    def rebuild(self):
+        try:
+            self.build()
+        finally:
+            self._rebuilding = False
+            connections.close_all()
+
+    def get_index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self.build()
+            return self._index
+        if self._version != get_version('ingredients'):
+            with self._lock:
+                start = not self._rebuilding
+                self._rebuilding = True
+            if start:
+                threading.Thread(target=self.rebuild, daemon=True).start()
+        return self._index
+
+    def search(self, prefix, limit):
+        """Первые limit ингредиентов, название которых начинается с prefix.
+
+        Точные совпадения идут первыми, остальные — по алфавиту.
+        """
+        keys, items = self.get_index()
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + PREFIX_END, lo=start)
+        return items[start:min(end, start + limit)]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,69 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from recipes.benchmark import compare, describe_data, run_benchmark
+
+BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = ('Замеряет основные эндпоинты через тестовый клиент и '
+            'сравнивает p95 и число SQL-запросов с базовой линией. '
+            'Данные для замеров создает команда seed_scale.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--baseline', default=BASELINE,
+            help='Файл базовой линии для сравнения.'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост p95 относительно базовой линии.'
+        )
+
+    def handle(self, *args, **options):
+        data = describe_data()
+        if not data['recipes']:
+            raise CommandError('В базе нет рецептов, запустите seed_scale')
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+        ):
+            results = run_benchmark(options['iterations'],
+                                    options['warmup'])
+        self.stdout.write(f'{"сценарий":<28}{"p50, мс":>10}{"p95, мс":>10}'
+                          f'{"SQL":>6}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<28}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["queries"]:>6}'
+            )
+        path = options['baseline']
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump({'data': data, 'results': results}, file,
+                          ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия: {path}'))
+            return
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['data'] != data:
+            self.stderr.write(
+                f'Базовая линия снята на других данных: {baseline["data"]}'
+            )
+        regressions = compare(results, baseline['results'],
+                              options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recipes.images import is_hashed_name, store_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Переносит старые картинки рецептов в хранилище по хешу '
+            'содержимого и строит для них уменьшенные копии.')
+
+    def handle(self, *args, **options):
+        converted = 0
+        recipes = Recipe.objects.exclude(image='').only('id', 'image')
+        for recipe in recipes.iterator():
+            if is_hashed_name(recipe.image.name):
+                continue
+            with recipe.image.open('rb') as image:
+                name = store_recipe_image(image)
+            Recipe.objects.filter(pk=recipe.pk).update(image=name)
+            converted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {converted}'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.similarity import similar_index
+
+
+class Command(BaseCommand):
+    help = ('Полностью пересобирает индекс похожих рецептов, в том числе '
+            'веса idf. Между сборками индекс обновляется по мере '
+            'сохранения рецептов.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        similar_index.rebuild()
+        index = similar_index.load()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов: {len(index["recipes"])}, ингредиентов: '
+            f'{len(index["columns"])}, связей: {len(index["ingredients"])}, '
+            f'{time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.bulk import batches
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+from recipes.parsers import read_ndjson
+from rest_framework.exceptions import ParseError
+
+BATCH_SIZE = 5000
+# SQLite ограничивает число параметров в одном запросе
+LOOKUP_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+FIELDS = ('name', 'measurement_unit')
+STAGING_TABLE = 'recipes_ingredient_import'
+
+
+def read_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if reader.line_num == 1 and tuple(
+            column.strip() for column in row
+        ) == FIELDS:
+            continue
+        yield dict(zip(FIELDS, row)) if len(row) == len(FIELDS) else None
+
+
+def read_json(file):
+    """Читает JSON-массив по одному элементу, не загружая файл целиком.
+
+    Понимает и простой список ингредиентов, и фикстуры Django:
+    записи других моделей пропускаются.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('ожидается JSON-массив')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if not isinstance(item, dict):
+            yield None
+        elif 'model' not in item:
+            yield item
+        elif item['model'] == 'recipes.ingredient':
+            yield item.get('fields')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+}
+EXTENSIONS = {'csv': 'csv', 'json': 'json', 'ndjson': 'ndjson',
+              'jsonl': 'ndjson'}
+
+
+def clean(record):
+    if not isinstance(record, dict):
+        return None
+    name = str(record.get('name') or '').strip()
+    unit = str(record.get('measurement_unit') or '').strip()
+    if not name or not unit or len(name) > 200 or len(unit) > 20:
+        return None
+    return name, unit
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает справочник ингредиентов из CSV, JSON или '
+            'NDJSON, пропуская уже существующие пары (название, единица).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с ингредиентами или - для '
+                                         'stdin.')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Строк в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or EXTENSIONS.get(
+            path.rsplit('.', 1)[-1].lower()
+        )
+        if file_format is None:
+            raise CommandError(
+                f'Не удалось определить формат {path}, укажите --format'
+            )
+        if connection.vendor == 'postgresql':
+            write_batch = self.copy_batch
+        else:
+            write_batch = self.insert_batch
+        file = (sys.stdin if path == '-'
+                else open(path, encoding='utf-8', newline=''))
+        self.skipped = 0
+        processed = created = 0
+        started = time.monotonic()
+        try:
+            with connection.cursor() as cursor:
+                for batch in batches(
+                    self.clean_records(READERS[file_format](file)),
+                    options['batch_size']
+                ):
+                    with transaction.atomic():
+                        created += write_batch(cursor, batch)
+                    processed += len(batch)
+                    self.report(processed, created, started)
+        except (ParseError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+            if created:
+                ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено ингредиентов: {created}, повторов и уже '
+            f'существующих: {processed - created}, пропущено '
+            f'некорректных записей: {self.skipped}'
+        ))
+
+    def clean_records(self, records):
+        for number, record in enumerate(records, 1):
+            pair = clean(record)
+            if pair is None:
+                self.skipped += 1
+                self.stderr.write(f'Запись {number} пропущена: {record!r}')
+            else:
+                yield pair
+
+    def report(self, processed, created, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Обработано {processed}, добавлено {created}, '
+            f'{processed / elapsed if elapsed else 0:.0f} строк/с'
+        )
+
+    def copy_batch(self, cursor, batch):
+        """PostgreSQL: COPY во временную таблицу и один INSERT ... SELECT."""
+        table = Ingredient._meta.db_table
+        cursor.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} '
+            f'(name varchar(200), measurement_unit varchar(20))'
+        )
+        cursor.execute(f'TRUNCATE {STAGING_TABLE}')
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {STAGING_TABLE} (name, measurement_unit) '
+            f'FROM STDIN WITH (FORMAT csv)', buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT DISTINCT s.name, s.measurement_unit '
+            f'FROM {STAGING_TABLE} s WHERE NOT EXISTS ('
+            f'SELECT 1 FROM {table} i WHERE i.name = s.name '
+            f'AND i.measurement_unit = s.measurement_unit)'
+        )
+        return cursor.rowcount
+
+    def insert_batch(self, cursor, batch):
+        pairs = dict.fromkeys(batch)
+        existing = set()
+        for names in batches({name for name, _ in pairs}, LOOKUP_SIZE):
+            existing.update(Ingredient.objects.filter(
+                name__in=names
+            ).values_list('name', 'measurement_unit'))
+        new = [
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in pairs if (name, unit) not in existing
+        ]
+        Ingredient.objects.bulk_create(new, batch_size=LOOKUP_SIZE)
+        return len(new)
@@ -0,0 +1,64 @@
+import json
+import sys
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipes.bulk import import_recipes
+from recipes.parsers import read_ndjson
+from rest_framework.exceptions import ParseError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Импортирует рецепты из JSON-массива или NDJSON, '
+            'как POST /api/recipes/bulk/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с рецептами или - для stdin.')
+        parser.add_argument(
+            '--author', required=True,
+            help='Имя пользователя, от которого создаются рецепты.'
+        )
+        parser.add_argument(
+            '--format', choices=('json', 'ndjson'),
+            help='Формат файла; по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.RECIPE_BULK_BATCH_SIZE,
+            help='Рецептов в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["author"]} не найден'
+            )
+        path = options['path']
+        file_format = options['format'] or (
+            'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'json'
+        )
+        file = (sys.stdin if path == '-'
+                else open(path, encoding='utf-8'))
+        try:
+            if file_format == 'ndjson':
+                items = read_ndjson(file)
+            else:
+                items = json.load(file)
+                if not isinstance(items, list):
+                    raise ValueError('ожидается список рецептов')
+            result = import_recipes(author, items, options['batch_size'])
+        except (ParseError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        for error in result['errors']:
+            self.stderr.write(f'Рецепт {error["index"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {len(result["created"])}, '
+            f'с ошибками: {len(result["errors"])}'
+        ))
@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from requests.exceptions import ConnectionError
+
+from recipes.benchmark import run_load
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер запросами к избранному, корзине, '
+            'подпискам и поиску ингредиентов. Сохраненные результаты '
+            'позволяют сравнить запуск под WSGI и под ASGI.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--rounds', type=int, default=500,
+            help='Кругов по всем сценариям, по 7 запросов в круге.'
+        )
+        parser.add_argument('--output', help='Сохранить результаты в файл.')
+        parser.add_argument(
+            '--compare', help='Файл с результатами другого запуска.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = run_load(options['url'].rstrip('/'),
+                              options['concurrency'], options['rounds'])
+        except ConnectionError as error:
+            raise CommandError(f'Сервер недоступен: {error}')
+        other = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                other = json.load(file)
+        self.write_table(result, other)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+
+    def write_table(self, result, other):
+        self.stdout.write(
+            f'Запросов: {result["requests"]}, '
+            f'потоков: {result["concurrency"]}, '
+            f'запросов в секунду: {result["rps"]}'
+            + (f' (было {other["rps"]})' if other else '')
+        )
+        self.stdout.write(f'{"сценарий":<22}{"p50, мс":>10}{"p95, мс":>10}'
+                          f'{"ошибок":>8}' + (f'{"было p95":>10}'
+                                              if other else ''))
+        for name, current in result['scenarios'].items():
+            line = (f'{name:<22}{current["p50_ms"]:>10}'
+                    f'{current["p95_ms"]:>10}{current["errors"]:>8}')
+            if other and name in other['scenarios']:
+                line += f'{other["scenarios"][name]["p95_ms"]:>10}'
+            self.stdout.write(line)
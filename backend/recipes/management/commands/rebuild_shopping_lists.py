@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import ShoppingListLine
+from recipes.shopping_list import aggregate_shopping_lists
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает таблицу списков покупок по корзинам '
+            'пользователей или проверяет ее на расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не изменяя.'
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            (row['recipe__purchase__user'], row['ingredient']):
+                row['total_amount']
+            for row in aggregate_shopping_lists().iterator()
+        }
+        if options['check']:
+            self.check_drift(expected)
+            return
+        with transaction.atomic():
+            ShoppingListLine.objects.all().delete()
+            ShoppingListLine.objects.bulk_create(
+                (
+                    ShoppingListLine(user_id=user_id, ingredient_id=key,
+                                     total_amount=total_amount)
+                    for (user_id, key), total_amount in expected.items()
+                ),
+                batch_size=BATCH_SIZE,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано строк списков покупок: {len(expected)}'
+        ))
+
+    def check_drift(self, expected):
+        actual = {
+            (user_id, key): total_amount
+            for user_id, key, total_amount
+            in ShoppingListLine.objects.values_list(
+                'user', 'ingredient', 'total_amount'
+            ).iterator()
+        }
+        drift = [
+            (user_id, key, actual.get((user_id, key)),
+             expected.get((user_id, key)))
+            for user_id, key in expected.keys() | actual.keys()
+            if actual.get((user_id, key)) != expected.get((user_id, key))
+        ]
+        for user_id, key, found, needed in sorted(drift):
+            self.stdout.write(
+                f'user={user_id} ingredient={key}: '
+                f'в таблице {found}, должно быть {needed}'
+            )
+        if drift:
+            raise CommandError(f'Найдено расхождений: {len(drift)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from recipes.counters import COUNTERS, count_related
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики избранного, корзин, рецептов '
+            'и подписчиков или проверяет их на расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не изменяя.'
+        )
+
+    def handle(self, *args, **options):
+        drift = 0
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                actual = count_related(related_model, related_field)
+                stale = model.objects.annotate(actual=actual).exclude(
+                    **{field: F('actual')}
+                )
+                stale_ids = list(stale.values_list('pk', flat=True))
+                drift += len(stale_ids)
+                self.stdout.write(
+                    f'{model._meta.model_name}.{field}: '
+                    f'расхождений {len(stale_ids)}'
+                )
+                if options['check']:
+                    continue
+                # пересчитываются только разошедшиеся строки
+                for start in range(0, len(stale_ids), BATCH_SIZE):
+                    model.objects.filter(
+                        pk__in=stale_ids[start:start + BATCH_SIZE]
+                    ).update(**{field: actual})
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
+            return
+        if drift:
+            raise CommandError(f'Найдено расхождений: {drift}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
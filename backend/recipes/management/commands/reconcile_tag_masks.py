@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import Recipe
+from recipes.similarity import schedule_similar_update
+from recipes.tag_masks import get_actual_masks
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает маски тегов рецептов по связям с тегами '
+            'или проверяет их на расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не изменяя.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            actual = get_actual_masks()
+            stale = [
+                Recipe(id=recipe_id, tags_mask=actual.get(recipe_id, 0))
+                for recipe_id, mask in Recipe.objects.values_list(
+                    'id', 'tags_mask'
+                ).iterator()
+                if actual.get(recipe_id, 0) != mask
+            ]
+            self.stdout.write(f'recipe.tags_mask: расхождений {len(stale)}')
+            if stale and not options['check']:
+                Recipe.objects.bulk_update(stale, ['tags_mask'],
+                                           batch_size=BATCH_SIZE)
+                schedule_similar_update(recipe.id for recipe in stale)
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS('Маски тегов пересчитаны'))
+            return
+        if stale:
+            raise CommandError(f'Найдено расхождений: {len(stale)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
@@ -0,0 +1,213 @@
+import json
+import os
+import random
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from recipes.bulk import create_recipes
+from recipes.caching import bump_version
+from recipes.feed import backfill
+from recipes.images import store_recipe_image
+from recipes.models import (Favorites, Ingredient, IngredientForRecipe,
+                            Purchase, Recipe, Tag)
+from recipes.similarity import similar_index
+from recipes.tag_masks import assign_tag_bits, tags_mask
+from users.models import Follow
+
+User = get_user_model()
+
+FIXTURES = os.path.join(settings.BASE_DIR, 'data', 'fixtures.json')
+BATCH_SIZE = 1000
+WORDS = ('суп', 'салат', 'пирог', 'каша', 'рагу', 'паста', 'омлет',
+         'запеканка', 'котлеты', 'блины', 'плов', 'борщ', 'соус', 'торт')
+
+
+def zipf_weights(count, exponent=1.1):
+    """Накопленные веса: первые элементы популярнее, как в жизни."""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def draw_count(rng, mean):
+    """Размер выборки с экспоненциальным распределением и средним mean."""
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def sample(rng, items, cum_weights, size):
+    """До size разных элементов с заданными накопленными весами."""
+    size = min(size, len(items))
+    chosen = set()
+    for _ in range(size * 4):
+        chosen.add(rng.choices(items, cum_weights=cum_weights)[0])
+        if len(chosen) == size:
+            break
+    return chosen
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, корзинами и подписками для нагрузочных замеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=4,
+            help='Среднее число рецептов в корзине у пользователя.'
+        )
+        parser.add_argument(
+            '--follows', type=int, default=5,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имен создаваемых пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.load_reference_data()
+        with transaction.atomic():
+            users = self.seed_users(options['users'], options['prefix'])
+            recipes = self.seed_recipes(users, options['recipes'])
+            self.seed_relations(users, recipes, options)
+        call_command('reconcile_counters', stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.seed_feeds(users)
+        similar_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}'
+        ))
+
+    def load_reference_data(self):
+        if not Ingredient.objects.exists():
+            call_command('import_ingredients', FIXTURES, stdout=StringIO(),
+                         stderr=StringIO())
+        with open(FIXTURES, encoding='utf-8') as file:
+            tags = [item['fields'] for item in json.load(file)
+                    if item['model'] == 'recipes.tag']
+        Tag.objects.bulk_create([Tag(**fields) for fields in tags],
+                                ignore_conflicts=True)
+        assign_tag_bits()
+        bump_version('tags')
+
+    def seed_users(self, count, prefix):
+        password = make_password('seed-password')
+        start = User.objects.filter(username__startswith=prefix).count()
+        User.objects.bulk_create([
+            User(username=f'{prefix}{number}',
+                 email=f'{prefix}{number}@example.com',
+                 first_name='Тест', last_name=f'Пользователь {number}',
+                 password=password)
+            for number in range(start, start + count)
+        ], batch_size=BATCH_SIZE)
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True)[start:])
+
+    def seed_recipes(self, users, count):
+        rng = self.rng
+        buffer = BytesIO()
+        Image.new('RGB', (640, 480), (220, 180, 120)).save(buffer, 'JPEG')
+        image = store_recipe_image(ContentFile(buffer.getvalue()))
+        authors = users[:]
+        rng.shuffle(authors)
+        author_weights = zipf_weights(len(authors))
+        now = timezone.now()
+        recipes = []
+        for number in range(count):
+            recipe = Recipe(
+                author_id=rng.choices(authors, cum_weights=author_weights)[0],
+                name=f'{rng.choice(WORDS).capitalize()} №{number}',
+                text=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                cooking_time=rng.randint(5, 180),
+                image=image,
+            )
+            recipes.append(recipe)
+        for start in range(0, len(recipes), BATCH_SIZE):
+            create_recipes(recipes[start:start + BATCH_SIZE])
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                seconds=rng.randint(0, 365 * 24 * 3600)
+            )
+        self.seed_recipe_links(recipes)
+        Recipe.objects.bulk_update(recipes, ['pub_date', 'tags_mask'],
+                                   batch_size=BATCH_SIZE)
+        return recipes
+
+    def seed_recipe_links(self, recipes):
+        rng = self.rng
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        rng.shuffle(ingredients)
+        ingredient_weights = zipf_weights(len(ingredients), exponent=0.8)
+        tags = list(Tag.objects.all())
+        tags_through = Recipe.tags.through
+        tag_links, ingredient_links = [], []
+        for recipe in recipes:
+            recipe_tags = rng.sample(tags, rng.randint(1, min(3, len(tags))))
+            recipe.tags_mask = tags_mask(recipe_tags)
+            for tag in recipe_tags:
+                tag_links.append(tags_through(recipe_id=recipe.id,
+                                              tag_id=tag.id))
+            size = max(2, round(rng.gauss(8, 3)))
+            for ingredient in sample(rng, ingredients, ingredient_weights,
+                                     size):
+                ingredient_links.append(IngredientForRecipe(
+                    recipe_id=recipe.id, ingredient_id=ingredient,
+                    amount=rng.randint(1, 500),
+                ))
+        tags_through.objects.bulk_create(tag_links, batch_size=BATCH_SIZE)
+        IngredientForRecipe.objects.bulk_create(ingredient_links,
+                                                batch_size=BATCH_SIZE)
+
+    def seed_feeds(self, users):
+        # подписки созданы в обход subscribe, ленты заполняются отдельно
+        for follow in Follow.objects.filter(user_id__in=users).select_related(
+            'user', 'author'
+        ).iterator():
+            backfill(follow.user, follow.author)
+
+    def seed_relations(self, users, recipes, options):
+        rng = self.rng
+        popular = [recipe.id for recipe in recipes]
+        rng.shuffle(popular)
+        recipe_weights = zipf_weights(len(popular))
+        authors = sorted({recipe.author_id for recipe in recipes})
+        rng.shuffle(authors)
+        author_weights = zipf_weights(len(authors))
+        favorites, purchases, follows = [], [], []
+        for user in users:
+            for recipe in sample(
+                rng, popular, recipe_weights,
+                draw_count(rng, options['favorites'])
+            ):
+                favorites.append(Favorites(user_id=user, recipe_id=recipe))
+            for recipe in sample(
+                rng, popular, recipe_weights,
+                draw_count(rng, options['cart'])
+            ):
+                purchases.append(Purchase(user_id=user, recipe_id=recipe))
+            for author in sample(
+                rng, authors, author_weights,
+                draw_count(rng, options['follows'])
+            ) - {user}:
+                follows.append(Follow(user_id=user, author_id=author))
+        for model, rows in ((Favorites, favorites), (Purchase, purchases),
+                            (Follow, follows)):
+            model.objects.bulk_create(rows, batch_size=BATCH_SIZE,
+                                      ignore_conflicts=True)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from recipes.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = ('Учитывает в популярности рецептов добавления в избранное '
+            'и корзину после прошлого запуска. Запускается по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать популярность по всей истории, например '
+                 'после изменения TRENDING_HALF_LIFE.'
+        )
+
+    def handle(self, *args, **options):
+        events = update_trending(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Учтено событий: {events}'))
@@ -0,0 +1,123 @@
+from django.db import migrations, router
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+POSTGRESQL_SQL = [
+    f'''
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('{SEARCH_CONFIG}',
+                                     coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger
+    ON recipes_recipe
+    ''',
+    '''
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update()
+    ''',
+    '''
+    UPDATE recipes_recipe SET name = name WHERE search_vector IS NULL
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_gin
+    ON recipes_recipe USING gin (search_vector)
+    ''',
+]
+
+POSTGRESQL_REVERSE_SQL = [
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+    '''
+    DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger
+    ON recipes_recipe
+    ''',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+    'UPDATE recipes_recipe SET search_vector = NULL',
+]
+
+SQLITE_SQL = [
+    f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id'
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    ''',
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+class RunVendorSQL(migrations.RunSQL):
+    """RunSQL со своим SQL для каждой СУБД: {vendor: [запросы]}.
+
+    На остальных базах операция ничего не делает.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        self.run_for_vendor(app_label, schema_editor, self.sql)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        self.run_for_vendor(app_label, schema_editor, self.reverse_sql)
+
+    def run_for_vendor(self, app_label, schema_editor, sqls):
+        connection = schema_editor.connection
+        if router.allow_migrate(connection.alias, app_label, **self.hints):
+            self._run_sql(schema_editor, sqls.get(connection.vendor, []))
+
+
+class Migration(migrations.Migration):
+    # Индекс и триггеры полнотекстового поиска по рецептам. На SQLite
+    # миграция, пересоздающая таблицу recipes_recipe, удаляет и триггеры,
+    # поэтому такие миграции должны создавать их заново
+
+    dependencies = [
+        ('recipes', '0011_feed'),
+    ]
+
+    operations = [
+        RunVendorSQL(
+            sql={'postgresql': POSTGRESQL_SQL, 'sqlite': SQLITE_SQL},
+            reverse_sql={'postgresql': POSTGRESQL_REVERSE_SQL,
+                         'sqlite': SQLITE_REVERSE_SQL},
+        ),
+    ]
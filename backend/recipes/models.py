@@ -1,10 +1,15 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
 
 User = get_user_model()
 
+# бит 63 знаковый, поэтому в маске рецепта помещается 63 тега
+MAX_TAGS = 63
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -32,6 +37,12 @@ class Tag(models.Model):
             )
         ]
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит в маске тегов рецепта',
+        unique=True,
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Тэг'
@@ -40,6 +51,14 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.bit is None and Tag.objects.filter(
+            bit__isnull=False
+        ).count() >= MAX_TAGS:
+            raise ValidationError(
+                f'Тегов не может быть больше {MAX_TAGS}'
+            )
+
 
 class Ingredient(models.Model):
 
@@ -58,6 +77,10 @@ class Ingredient(models.Model):
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            models.Index(fields=['name', 'measurement_unit'],
+                         name='ingredient_name_unit_idx'),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -65,7 +88,7 @@ class Ingredient(models.Model):
 
 class Recipe(models.Model):
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE,
+        User, on_delete=models.CASCADE, db_index=False,
         related_name='recipes', verbose_name='Автор рецепта'
     )
     name = models.CharField(
@@ -95,11 +118,38 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации'
     )
+    search_vector = SearchVectorField(null=True, editable=False)
+    tags_mask = models.BigIntegerField(
+        default=0, editable=False, verbose_name='Маска тегов'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В списках покупок'
+    )
+    version = models.PositiveIntegerField(
+        default=1, editable=False, verbose_name='Версия'
+    )
+    # log2 суммы 2^((t - TRENDING_EPOCH) / полураспад) по добавлениям
+    # в избранное и корзину; см. recipes/trending.py
+    trending_score = models.FloatField(
+        default=0, editable=False, verbose_name='Популярность сейчас'
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['name'], name='recipe_name_idx'),
+            models.Index(fields=['-trending_score', '-id'],
+                         name='recipe_trending_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -128,7 +178,8 @@ class IngredientForRecipe(models.Model):
 
 class Favorites(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               db_index=False)
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата добавления')
 
@@ -140,6 +191,11 @@ class Favorites(models.Model):
                 fields=['user', 'recipe'], name='unique_favorite',
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+            models.Index(fields=['pub_date'], name='favorite_pub_date_idx'),
+        ]
 
     def __str__(self):
         return f'Рецепт {self.recipe} в избранном у {self.user}'
@@ -148,7 +204,8 @@ class Favorites(models.Model):
 class Purchase(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name='purchases')
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               db_index=False)
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата добавления')
 
@@ -161,6 +218,76 @@ class Purchase(models.Model):
                 fields=['user', 'recipe'], name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='purchase_recipe_user_idx'),
+            models.Index(fields=['pub_date'], name='purchase_pub_date_idx'),
+        ]
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListLine(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    total_amount = models.IntegerField(verbose_name='Общее количество')
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_shopping_line'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.total_amount} у {self.user}'
+
+
+class TrendingWatermark(models.Model):
+    """До какого момента события учтены в Recipe.trending_score.
+
+    В таблице одна строка с pk=1, ее обновляет команда update_trending.
+    """
+    processed_until = models.DateTimeField(
+        verbose_name='События учтены до'
+    )
+
+    class Meta:
+        verbose_name = 'Отметка пересчета популярности'
+        verbose_name_plural = 'Отметки пересчета популярности'
+
+    def __str__(self):
+        return f'Популярность учтена до {self.processed_until}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика, записанный при публикации."""
+    # индекс по user дает уникальность (user, recipe)
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             db_index=False, related_name='feed')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               db_index=False, related_name='+')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте у {self.user}'
@@ -0,0 +1,60 @@
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .trending import TRENDING_ORDERING
+
+APPROXIMATE_COUNT_LIMIT = 1000
+
+
+def estimate_count(queryset):
+    """Приблизительное число строк без полного COUNT(*).
+
+    На PostgreSQL берется оценка планировщика, на остальных базах
+    строки считаются только до APPROXIMATE_COUNT_LIMIT.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+    return queryset[:APPROXIMATE_COUNT_LIMIT + 1].count()
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсор по pub_date или по популярности.
+
+    Курсор строится по значениям полей сортировки, а у релевантности
+    поиска такого поля нет, поэтому поиск с курсором не поддерживается.
+    """
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('ordering') == 'trending':
+            return TRENDING_ORDERING
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('search', '').split():
+            raise ValidationError({'pagination': (
+                'Результаты поиска упорядочены по релевантности '
+                'и не листаются курсором'
+            )})
+        self.approximate_count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('approximate_count', self.approximate_count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
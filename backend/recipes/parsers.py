@@ -0,0 +1,27 @@
+import codecs
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def read_ndjson(lines):
+    """Разбирает NDJSON построчно, пустые строки пропускаются."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            raise ParseError(f'Строка {number}: {error}')
+
+
+class NDJSONParser(BaseParser):
+    """Один JSON-объект на строку, результат — список объектов."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return list(read_ndjson(codecs.getreader(encoding)(stream)))
@@ -0,0 +1,89 @@
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from users.models import Follow
+
+from .caching import get_version
+from .models import Favorites, Purchase
+
+
+def relations_namespace(user_id):
+    return f'relations:{user_id}'
+
+
+class IdSet:
+    """Отсортированный массив id с проверкой вхождения через bisect."""
+
+    def __init__(self, ids=()):
+        self.ids = array('q', sorted(ids))
+
+    def __contains__(self, value):
+        index = bisect_left(self.ids, value)
+        return index < len(self.ids) and self.ids[index] == value
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+class UserRelations:
+    """Избранное, корзина и подписки пользователя в виде множеств id."""
+
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = IdSet(favorites)
+        self.cart = IdSet(cart)
+        self.following = IdSet(following)
+
+    def dump(self):
+        return (self.favorites.ids.tobytes(), self.cart.ids.tobytes(),
+                self.following.ids.tobytes())
+
+    @classmethod
+    def load(cls, data):
+        relations = cls()
+        for id_set, raw in zip(
+            (relations.favorites, relations.cart, relations.following), data
+        ):
+            id_set.ids.frombytes(raw)
+        return relations
+
+    @classmethod
+    def from_db(cls, user_id):
+        return cls(
+            Favorites.objects.filter(user=user_id).values_list(
+                'recipe', flat=True
+            ),
+            Purchase.objects.filter(user=user_id).values_list(
+                'recipe', flat=True
+            ),
+            Follow.objects.filter(user=user_id).values_list(
+                'author', flat=True
+            ),
+        )
+
+
+ANONYMOUS_RELATIONS = UserRelations()
+
+
+def get_user_relations(request):
+    """Связи текущего пользователя из кеша, не чаще раза за запрос.
+
+    Ключ включает версию, которую сигналы увеличивают при любом
+    изменении Favorites, Purchase или Follow этого пользователя.
+    """
+    if request is None or request.user.is_anonymous:
+        return ANONYMOUS_RELATIONS
+    relations = getattr(request, 'user_relations', None)
+    if relations is not None:
+        return relations
+    namespace = relations_namespace(request.user.id)
+    key = f'{namespace}:{get_version(namespace)}'
+    data = cache.get(key)
+    if data is None:
+        relations = UserRelations.from_db(request.user.id)
+        cache.set(key, relations.dump(), settings.RELATIONS_CACHE_TIMEOUT)
+    else:
+        relations = UserRelations.load(data)
+    request.user_relations = relations
+    return relations
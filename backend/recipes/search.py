@@ -0,0 +1,36 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+SEARCH_CONFIG = 'russian'
+# индекс, триггеры и FTS-таблица создаются миграцией 0012_search_index
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def fts5_query(text):
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in text.split()
+    )
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, от более релевантных к менее."""
+    if not text.split():
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+    if connection.vendor == 'sqlite':
+        # соединение с FTS-таблицей выполняет MATCH один раз на запрос;
+        # коррелированный подзапрос повторял бы его для каждого рецепта
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[fts5_query(text)],
+            select={'rank': f'-bm25({FTS_TABLE}, 10.0, 1.0)'},
+        ).order_by('-rank', '-pub_date', '-id')
+    return queryset.filter(name__icontains=text)
@@ -1,11 +1,20 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.http import Http404
 from rest_framework import serializers
 from users.serializers import CustomUserSerializer
 
+from .counters import change_counter
+from .feed import fan_out
+from .fields import ImageDerivativesField, RecipeImageField
+from .images import store_recipe_image
 from .models import (Favorites, Ingredient, IngredientForRecipe, Purchase,
                      Recipe, Tag)
+from .relations import get_user_relations
+from .shopping_list import update_recipe_in_shopping_lists
+from .similarity import schedule_similar_update
+from .tag_masks import tags_mask
 
 User = get_user_model()
 
@@ -93,21 +102,22 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
                                               many=True)
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
+    images = ImageDerivativesField(source='image')
     ingredients = IngredientForRecipeCreate(many=True)
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text',
+            'is_in_shopping_cart', 'name', 'image', 'images', 'text',
             'cooking_time', 'pub_date'
         ]
 
     def validate(self, data):
         errors_data = {
             'duplicate_recipes': {
-                "errors": f"Рецепт с таким названием: {data['name']} уже "
+                "errors": f"Рецепт с таким названием: {data.get('name')} уже "
                           f"существует"},
             'duplicate_ingredients': {
                 "errors": "Такой ингредиент уже существует"},
@@ -115,11 +125,11 @@ class RecipeSerializer(serializers.ModelSerializer):
                 'amount': 'Убедитесь, что указали значение больше 0.'}
         }
         request = self.context['request']
-        ingredients = data['ingredients']
-        exist_recipe = Recipe.objects.filter(name=data['name']).exists()
-        if request.method == 'POST' and exist_recipe:
+        ingredients = data.get('ingredients', [])
+        if (request.method == 'POST'
+                and Recipe.objects.filter(name=data['name']).exists()):
             raise serializers.ValidationError(errors_data['duplicate_recipes'])
-        unique_ingredients = []
+        unique_ingredients = set()
         for ingredient in ingredients:
             if ingredient['id'] in unique_ingredients:
                 raise serializers.ValidationError(
@@ -127,54 +137,133 @@ class RecipeSerializer(serializers.ModelSerializer):
                 )
             elif ingredient['amount'] < 1:
                 raise serializers.ValidationError(errors_data['amount_field'])
-            unique_ingredients.append(ingredient['id'])
+            unique_ingredients.add(ingredient['id'])
         return data
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Favorites.objects.filter(user=request.user, recipe=obj).exists()
+        relations = get_user_relations(self.context.get('request'))
+        return obj.id in relations.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Purchase.objects.filter(user=request.user, recipe=obj).exists()
+        relations = get_user_relations(self.context.get('request'))
+        return obj.id in relations.cart
 
+    @staticmethod
+    def create_ingredients(recipe, ingredients):
+        found = Ingredient.objects.in_bulk(
+            [ingredient['id'] for ingredient in ingredients]
+        )
+        if len(found) != len(ingredients):
+            raise Http404('Ингредиент не найден')
+        IngredientForRecipe.objects.bulk_create([
+            IngredientForRecipe(
+                recipe=recipe, ingredient=found[ingredient['id']],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        ])
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
         ingredients = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
+        validated_data['image'] = store_recipe_image(validated_data['image'])
+        validated_data['tags_mask'] = tags_mask(tags_data)
         recipe = Recipe.objects.create(author=request.user, **validated_data)
+        change_counter(request.user, 'recipes_count', 1)
         recipe.tags.set(tags_data)
-        ingredient_in_recipe = [IngredientForRecipe(
-            recipe=recipe,
-            ingredient=get_object_or_404(Ingredient, pk=ingredient['id']),
-            amount=ingredient['amount']
-        )
-            for ingredient in ingredients
-        ]
-        IngredientForRecipe.objects.bulk_create(ingredient_in_recipe)
-        recipe.save()
+        self.create_ingredients(recipe, ingredients)
+        fan_out(request.user, [recipe])
+        schedule_similar_update([recipe.id])
         return recipe
 
-    def update(self, recipe, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags_data = validated_data.pop('tags')
-        recipe.ingredients.clear()
-        ingredient_in_recipe = [IngredientForRecipe(
-            recipe=recipe,
-            ingredient=get_object_or_404(Ingredient, id=ingredient['id']),
-            amount=ingredient['amount']
-        )
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Приводит строки IngredientForRecipe к новому составу.
+
+        Меняются только отличающиеся строки: новые вставляются, лишние
+        удаляются, у оставшихся обновляется количество. Возвращает
+        прежний состав {id ингредиента: количество} и прежние количества
+        оставшихся строк: удаленные строки из списков покупок вычитает
+        сигнал post_delete.
+
+        Строки читаются заново под блокировкой: кэш prefetch_related
+        заполнен до блокировки рецепта и мог устареть.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
             for ingredient in ingredients
-        ]
-        IngredientForRecipe.objects.bulk_create(ingredient_in_recipe)
+        }
+        old_amounts, rows, to_delete = {}, {}, []
+        for row in IngredientForRecipe.objects.filter(
+            recipe=recipe
+        ).select_for_update():
+            old_amounts[row.ingredient_id] = (
+                old_amounts.get(row.ingredient_id, 0) + row.amount
+            )
+            # повторы одного ингредиента тоже удаляются
+            if row.ingredient_id in rows or row.ingredient_id not in amounts:
+                to_delete.append(row.id)
+            else:
+                rows[row.ingredient_id] = row
+        kept_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in rows.items()
+        }
+        to_update = []
+        for ingredient_id, row in rows.items():
+            if row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                to_update.append(row)
+        if to_delete:
+            IngredientForRecipe.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            IngredientForRecipe.objects.bulk_update(to_update, ['amount'])
+        RecipeSerializer.create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in rows
+        ])
+        return old_amounts, kept_amounts
+
+    @transaction.atomic
+    def update(self, recipe, validated_data):
+        """Сохраняет только изменившиеся поля и связи рецепта.
+
+        Версию рецепта заранее увеличивает представление вместе
+        с проверкой If-Match, здесь она только записывается.
+        """
+        ingredients = validated_data.pop('ingredients', None)
+        tags_data = validated_data.pop('tags', None)
+        if ingredients is not None:
+            old_amounts, kept_amounts = self.update_ingredients(
+                recipe, ingredients
+            )
+            new_amounts = {
+                ingredient['id']: ingredient['amount']
+                for ingredient in ingredients
+            }
+            if new_amounts != kept_amounts:
+                update_recipe_in_shopping_lists(
+                    recipe, kept_amounts, new_amounts
+                )
+            if new_amounts.keys() != old_amounts.keys():
+                schedule_similar_update([recipe.id])
+        if tags_data is not None:
+            recipe.tags.set(tags_data)
+            validated_data['tags_mask'] = tags_mask(tags_data)
+            if validated_data['tags_mask'] != recipe.tags_mask:
+                schedule_similar_update([recipe.id])
         if validated_data.get('image') is not None:
-            recipe.image = validated_data.get('image', recipe.image)
-        recipe.tags.set(tags_data)
-        return super().update(recipe, validated_data)
+            validated_data['image'] = store_recipe_image(
+                validated_data['image']
+            )
+        changed = ['version']
+        for field, value in validated_data.items():
+            if getattr(recipe, field) != value:
+                setattr(recipe, field, value)
+                changed.append(field)
+        recipe.save(update_fields=changed)
+        return recipe
 
 
 class RecipeReadSerializer(RecipeSerializer):
@@ -183,5 +272,12 @@ class RecipeReadSerializer(RecipeSerializer):
     ingredients = serializers.SerializerMethodField()
 
     def get_ingredients(self, obj):
-        ingredients = IngredientForRecipe.objects.filter(recipe=obj)
+        ingredients = obj.ingredientforrecipe_set.all()
         return IngredientForRecipeSerializer(ingredients, many=True).data
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+    )
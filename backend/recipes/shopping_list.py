@@ -0,0 +1,155 @@
+import csv
+import io
+import os
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .models import IngredientForRecipe, Purchase, ShoppingListLine
+
+CHUNK_SIZE = 8192
+
+
+def get_shopping_list(user):
+    return ShoppingListLine.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit', 'total_amount'
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def aggregate_shopping_lists():
+    """Списки покупок всех пользователей, посчитанные заново по корзинам."""
+    return IngredientForRecipe.objects.filter(
+        recipe__purchase__isnull=False
+    ).values(
+        'recipe__purchase__user', 'ingredient'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by()
+
+
+def get_recipe_amounts(recipe):
+    return dict(
+        IngredientForRecipe.objects.filter(recipe=recipe).values(
+            'ingredient'
+        ).annotate(
+            total_amount=Sum('amount')
+        ).order_by().values_list('ingredient', 'total_amount')
+    )
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    """Прибавляет delta {id ингредиента: количество} к спискам покупок."""
+    delta = {key: value for key, value in delta.items() if value}
+    user_ids = list(user_ids)
+    if not delta or not user_ids:
+        return
+    lines = ShoppingListLine.objects.filter(user__in=user_ids)
+    with transaction.atomic():
+        # сначала недостающие строки с нулем: параллельная корзина с тем же
+        # ингредиентом не упадет на unique_shopping_line, а дождется
+        # блокировки строки и прибавит свое в общем UPDATE
+        ShoppingListLine.objects.bulk_create(
+            [ShoppingListLine(user_id=user_id, ingredient_id=key,
+                              total_amount=0)
+             for user_id in user_ids
+             for key, value in delta.items() if value > 0],
+            ignore_conflicts=True,
+        )
+        lines.filter(ingredient__in=delta).update(
+            total_amount=F('total_amount') + Case(
+                *[When(ingredient=key, then=Value(value))
+                  for key, value in delta.items()],
+                output_field=models.IntegerField(),
+            )
+        )
+        lines.filter(total_amount__lte=0).delete()
+
+
+def update_recipe_in_shopping_lists(recipe, old_amounts, new_amounts):
+    apply_shopping_list_delta(
+        Purchase.objects.filter(recipe=recipe).values_list('user', flat=True),
+        {key: new_amounts.get(key, 0) - old_amounts.get(key, 0)
+         for key in old_amounts.keys() | new_amounts.keys()}
+    )
+
+
+def add_to_shopping_list(user, recipe):
+    apply_shopping_list_delta([user.id], get_recipe_amounts(recipe))
+
+
+def remove_from_shopping_list(purchase):
+    amounts = get_recipe_amounts(purchase.recipe_id)
+    apply_shopping_list_delta(
+        [purchase.user_id], {key: -value for key, value in amounts.items()}
+    )
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: отдает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+# Рендеры отдаются в StreamingHttpResponse и под ASGI перебираются в цикле
+# событий: получают уже прочитанные строки и к ORM не обращаются.
+def render_txt(items):
+    for item in items:
+        yield (
+            f'{item["ingredient__name"]} - {item["total_amount"]}, '
+            f'{item["ingredient__measurement_unit"]}\n'
+        )
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Ингредиент', 'Количество', 'Единица измерения'])
+    for item in items:
+        yield writer.writerow([
+            item['ingredient__name'],
+            item['total_amount'],
+            item['ingredient__measurement_unit'],
+        ])
+
+
+def get_pdf_font():
+    font_path = settings.SHOPPING_LIST_PDF_FONT
+    if not os.path.exists(font_path):
+        return 'Helvetica'
+    if 'ShoppingListFont' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont('ShoppingListFont', font_path))
+    return 'ShoppingListFont'
+
+
+def render_pdf(items):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    height = A4[1]
+    top, bottom, left, line_height = height - 50, 50, 50, 18
+    pdf.setFont(font, 16)
+    pdf.drawString(left, top, 'Список покупок')
+    y = top - 2 * line_height
+    pdf.setFont(font, 12)
+    for line in render_txt(items):
+        if y < bottom:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = top
+        pdf.drawString(left, y, line.rstrip('\n'))
+        y -= line_height
+    pdf.save()
+    buffer.seek(0)
+    return iter(lambda: buffer.read(CHUNK_SIZE), b'')
+
+
+FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
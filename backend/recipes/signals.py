@@ -0,0 +1,112 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from import_export.signals import post_import
+from users.models import Follow
+
+from .caching import bump_version
+from .counters import COUNTERS, change_counter
+from .ingredient_index import ingredient_index
+from .models import (Favorites, Ingredient, IngredientForRecipe, Purchase,
+                     Recipe, Tag)
+from .relations import relations_namespace
+from .shopping_list import (remove_from_shopping_list,
+                            update_recipe_in_shopping_lists)
+from .similarity import similar_index
+from .tag_masks import assign_tag_bits, clear_tag_bit
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+def assign_tag_bit(sender, instance, **kwargs):
+    if instance.bit is None:
+        assign_tag_bits()
+        instance.refresh_from_db(fields=['bit'])
+
+
+@receiver(post_delete, sender=Tag)
+def release_tag_bit(sender, instance, **kwargs):
+    # бит может достаться новому тегу, старые рецепты не должны с ним
+    # совпадать
+    if instance.bit is not None:
+        clear_tag_bit(instance.bit)
+        transaction.on_commit(similar_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, 'tags'))
+
+
+@receiver(post_import)
+def invalidate_after_import(sender, model, **kwargs):
+    if model is Ingredient:
+        ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_delete, sender=Favorites)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_user_relations(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(bump_version, relations_namespace(instance.user_id))
+    )
+
+
+# Списки покупок поддерживаются и при правках в обход API: в админке
+# и при каскадном удалении. При удалении рецепта порядок удаления корзин
+# и строк состава не важен: что удалено первым, то и вычитается.
+@receiver(pre_save, sender=IngredientForRecipe)
+def subtract_old_recipe_row(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old = IngredientForRecipe.objects.filter(pk=instance.pk).first()
+    if old is not None:
+        update_recipe_in_shopping_lists(
+            old.recipe_id, {old.ingredient_id: old.amount}, {}
+        )
+
+
+@receiver(post_save, sender=IngredientForRecipe)
+def add_recipe_row(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_recipe_in_shopping_lists(
+            instance.recipe_id, {}, {instance.ingredient_id: instance.amount}
+        )
+
+
+@receiver(post_delete, sender=IngredientForRecipe)
+def subtract_recipe_row(sender, instance, **kwargs):
+    update_recipe_in_shopping_lists(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+    )
+
+
+@receiver(post_delete, sender=Purchase)
+def subtract_purchase(sender, instance, **kwargs):
+    remove_from_shopping_list(instance)
+
+
+# Счетчики уменьшаются при любом удалении, в том числе из админки
+# и каскадом; увеличивают их сами операции добавления.
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counters(sender, instance, **kwargs):
+    for model, field, counted_model, link in COUNTERS:
+        if counted_model is sender:
+            change_counter(
+                model(pk=getattr(instance, f'{link}_id')), field, -1
+            )
@@ -0,0 +1,401 @@
+import fcntl
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import IngredientForRecipe, Recipe
+
+CURRENT = 'CURRENT'
+DIRTY = 'dirty'
+STALE = 'stale'
+LOCK = 'lock'
+ARRAYS = ('recipes', 'indptr', 'ingredients', 'weights', 'vocabulary',
+          'idf', 'columns', 'col_ptr', 'col_rows', 'col_weights', 'tags')
+# при большом числе изменений проще пересобрать индекс целиком
+FULL_REBUILD_SHARE = 0.1
+
+
+def smooth_idf(total, document_frequency):
+    return np.log((1 + total) / (1 + document_frequency)) + 1
+
+
+def load_pairs(recipe_ids=None):
+    """Пары (рецепт, ингредиент) из IngredientForRecipe без повторов."""
+    pairs = IngredientForRecipe.objects.order_by()
+    if recipe_ids is not None:
+        pairs = pairs.filter(recipe_id__in=recipe_ids)
+    pairs = np.array(
+        list(pairs.values_list('recipe_id', 'ingredient_id').iterator()),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return np.unique(pairs, axis=0)
+
+
+def make_rows(recipe_ids, pairs, vocabulary, idf):
+    """Нормированные строки TF-IDF для рецептов recipe_ids.
+
+    Вес ингредиента в рецепте - его idf: количества в разных единицах
+    измерения между собой не сравнимы. Строка нормируется по L2,
+    поэтому скалярное произведение строк равно косинусной близости.
+    """
+    # рецепты, созданные после выборки recipe_ids, попадут в индекс позже
+    pairs = pairs[np.isin(pairs[:, 0], recipe_ids)]
+    rows = np.searchsorted(recipe_ids, pairs[:, 0])
+    ingredients = pairs[:, 1]
+    weights = idf[np.searchsorted(vocabulary, ingredients)].astype(
+        np.float32
+    )
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2,
+                                minlength=len(recipe_ids)))
+    weights /= norms[rows]
+    indptr = np.zeros(len(recipe_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(recipe_ids)), out=indptr[1:])
+    return indptr, ingredients, weights
+
+
+def invert(recipe_ids, indptr, ingredients, weights):
+    """Обратный индекс: для каждого ингредиента строки рецептов с ним."""
+    rows = np.repeat(np.arange(len(recipe_ids), dtype=np.int32),
+                     np.diff(indptr))
+    order = np.argsort(ingredients, kind='stable')
+    columns, counts = np.unique(ingredients[order], return_counts=True)
+    col_ptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    np.cumsum(counts, out=col_ptr[1:])
+    return columns, col_ptr, rows[order], weights[order]
+
+
+def load_recipes(recipe_ids=None):
+    """id и маски тегов рецептов по возрастанию id."""
+    recipes = Recipe.objects.order_by('id')
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    recipes = np.array(
+        list(recipes.values_list('id', 'tags_mask').iterator()),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return recipes[:, 0].copy(), recipes[:, 1].copy()
+
+
+def build_arrays():
+    recipe_ids, tags = load_recipes()
+    pairs = load_pairs()
+    vocabulary, frequency = np.unique(pairs[:, 1], return_counts=True)
+    idf = smooth_idf(len(recipe_ids), frequency)
+    indptr, ingredients, weights = make_rows(recipe_ids, pairs, vocabulary,
+                                             idf)
+    return dict(
+        zip(ARRAYS[4:], (vocabulary, idf, *invert(
+            recipe_ids, indptr, ingredients, weights
+        ))),
+        recipes=recipe_ids, indptr=indptr, ingredients=ingredients,
+        weights=weights, tags=tags,
+    )
+
+
+def patch_arrays(index, changed):
+    """Пересчитывает строки измененных рецептов, не трогая остальные.
+
+    idf остается от последней полной сборки, новым ингредиентам
+    достается idf ингредиента, встреченного один раз. Удаленные рецепты
+    пропадают из индекса.
+    """
+    changed = np.unique(np.array(changed, dtype=np.int64))
+    keep = ~np.isin(index['recipes'], changed)
+    keep_nnz = np.repeat(keep, np.diff(index['indptr']))
+    fresh, fresh_tags = load_recipes(changed.tolist())
+    pairs = load_pairs(fresh.tolist())
+    vocabulary, idf = index['vocabulary'], index['idf']
+    unknown = np.setdiff1d(pairs[:, 1], vocabulary)
+    if len(unknown):
+        vocabulary = np.concatenate([vocabulary, unknown])
+        idf = np.concatenate([idf, np.full(
+            len(unknown), smooth_idf(len(index['recipes']), 1)
+        )])
+        order = np.argsort(vocabulary)
+        vocabulary, idf = vocabulary[order], idf[order]
+    new_indptr, new_ingredients, new_weights = make_rows(
+        fresh, pairs, vocabulary, idf
+    )
+    nnz_recipes = np.concatenate([
+        np.repeat(index['recipes'], np.diff(index['indptr']))[keep_nnz],
+        np.repeat(fresh, np.diff(new_indptr)),
+    ])
+    ingredients = np.concatenate([index['ingredients'][keep_nnz],
+                                  new_ingredients])
+    weights = np.concatenate([index['weights'][keep_nnz], new_weights])
+    order = np.lexsort((ingredients, nnz_recipes))
+    nnz_recipes = nnz_recipes[order]
+    ingredients, weights = ingredients[order], weights[order]
+    recipe_ids = np.concatenate([index['recipes'][keep], fresh])
+    order = np.argsort(recipe_ids, kind='stable')
+    recipe_ids = recipe_ids[order]
+    tags = np.concatenate([index['tags'][keep], fresh_tags])[order]
+    indptr = np.append(np.searchsorted(nnz_recipes, recipe_ids),
+                       len(nnz_recipes))
+    return dict(
+        zip(ARRAYS[6:], invert(recipe_ids, indptr, ingredients, weights)),
+        recipes=recipe_ids, indptr=indptr, ingredients=ingredients,
+        weights=weights, vocabulary=vocabulary, idf=idf, tags=tags,
+    )
+
+
+def schedule_similar_update(recipe_ids):
+    """После коммита отмечает рецепты для пересчета в индексе.
+
+    Нужно при изменении состава, тегов и при удалении рецепта.
+    """
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: similar_index.mark_dirty(recipe_ids))
+
+
+class SimilarRecipesIndex:
+    """Индекс рецептов по ингредиентам в файлах .npy, общий для воркеров.
+
+    Строки (recipes, indptr, ingredients, weights) - состав рецептов,
+    столбцы (columns, col_ptr, col_rows, col_weights) - обратный индекс
+    ингредиент -> рецепты, tags - маски тегов. По нему считаются похожие
+    рецепты и подбор рецептов по продуктам.
+
+    Каждая сборка пишется в отдельный каталог, файл CURRENT указывает
+    на действующую; воркеры открывают массивы через mmap и замечают
+    новую сборку по времени изменения CURRENT. Сохраненные рецепты
+    дописываются в файл dirty, файл stale требует полной сборки.
+    Заметив их, запрос запускает обновление в фоновом потоке и отвечает
+    по действующей сборке, не дожидаясь его. Синхронно индекс строится
+    только при первом запуске, когда отвечать еще не по чему. Полная
+    сборка (команда build_similar_index) обновляет еще и idf.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._index = None
+        self._updating = False
+
+    @property
+    def path(self):
+        return settings.SIMILAR_INDEX_DIR
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def mark_dirty(self, recipe_ids):
+        if not os.path.exists(self.file(CURRENT)):
+            return
+        # короткая запись с O_APPEND атомарна и для нескольких процессов
+        with open(self.file(DIRTY), 'a') as file:
+            file.write(''.join(f'{recipe_id}\n' for recipe_id in recipe_ids))
+
+    def invalidate(self):
+        """Требует полной сборки; до нее запросы идут по текущей."""
+        if os.path.exists(self.file(CURRENT)):
+            open(self.file(STALE), 'a').close()
+
+    @contextmanager
+    def locked(self, wait=True):
+        """Блокировка сборки между процессами.
+
+        Без wait отдает False, если блокировку держит другой процесс.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.file(LOCK), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if wait
+                                                   else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+
+    def read_generation(self):
+        try:
+            with open(self.file(CURRENT)) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def rebuild(self, changed=None):
+        """Собирает индекс целиком или только для рецептов changed."""
+        with self.locked():
+            if changed is None and os.path.exists(self.file(STALE)):
+                os.remove(self.file(STALE))
+            self._rebuild(changed)
+
+    def _rebuild(self, changed):
+        index = self.load()
+        if changed is None or index is None or (
+            len(changed) > FULL_REBUILD_SHARE * len(index['recipes'])
+        ):
+            arrays = build_arrays()
+        else:
+            arrays = patch_arrays(index, changed)
+        previous = self.read_generation()
+        generation = str(time.time_ns())
+        target = self.file(generation)
+        os.makedirs(target + '.tmp')
+        for name in ARRAYS:
+            np.save(os.path.join(target + '.tmp', name), arrays[name])
+        os.rename(target + '.tmp', target)
+        with open(self.file(CURRENT + '.tmp'), 'w') as file:
+            file.write(generation)
+        os.replace(self.file(CURRENT + '.tmp'), self.file(CURRENT))
+        # предыдущую сборку еще может открывать другой воркер, а уже
+        # открытые через mmap файлы доступны и после удаления
+        for name in os.listdir(self.path):
+            if name.isdigit() and name not in (generation, previous):
+                shutil.rmtree(self.file(name), ignore_errors=True)
+
+    def load(self):
+        """Открывает действующую сборку, если она сменилась."""
+        try:
+            stat = os.stat(self.file(CURRENT))
+        except FileNotFoundError:
+            return None
+        # os.replace каждый раз дает новый inode
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._stamp:
+            return self._index
+        with self._lock:
+            if stamp != self._stamp:
+                directory = self.file(self.read_generation())
+                self._index = {
+                    name: np.load(os.path.join(directory, f'{name}.npy'),
+                                  mmap_mode='r')
+                    for name in ARRAYS
+                }
+                self._stamp = stamp
+        return self._index
+
+    def update(self):
+        """Применяет накопившиеся изменения: stale или рецепты из dirty.
+
+        Если индекс уже обновляет другой процесс, ничего не делает.
+        """
+        with self.locked(wait=False) as acquired:
+            if not acquired:
+                return
+            processing = self.file(DIRTY + '.processing')
+            try:
+                os.rename(self.file(DIRTY), processing)
+            except FileNotFoundError:
+                if not os.path.exists(self.file(STALE)):
+                    return
+                open(processing, 'w').close()
+            with open(processing) as file:
+                changed = [int(line) for line in file if line.endswith('\n')]
+            # отметка снимается до сборки: изменения во время нее
+            # поставят новую
+            if os.path.exists(self.file(STALE)):
+                os.remove(self.file(STALE))
+                changed = None
+            if changed != []:
+                self._rebuild(changed)
+            os.remove(processing)
+
+    def update_in_background(self):
+        try:
+            self.update()
+        finally:
+            self._updating = False
+            connections.close_all()
+
+    def get(self):
+        if not os.path.exists(self.file(CURRENT)):
+            with self.locked():
+                # пока ждали блокировку, индекс мог собрать другой процесс
+                if not os.path.exists(self.file(CURRENT)):
+                    self._rebuild(None)
+        elif (os.path.exists(self.file(DIRTY))
+              or os.path.exists(self.file(STALE))):
+            with self._lock:
+                start = not self._updating
+                self._updating = True
+            if start:
+                threading.Thread(target=self.update_in_background,
+                                 daemon=True).start()
+        return self.load()
+
+    def similar(self, recipe_id, limit):
+        """Рецепты, ближайшие к recipe_id по косинусу векторов TF-IDF.
+
+        Возвращает [(id рецепта, близость)] по убыванию близости или None,
+        если рецепта нет в индексе.
+        """
+        index = self.get()
+        recipes = index['recipes']
+        row = int(np.searchsorted(recipes, recipe_id))
+        if row == len(recipes) or recipes[row] != recipe_id:
+            return None
+        start, end = index['indptr'][row], index['indptr'][row + 1]
+        columns, col_ptr = index['columns'], index['col_ptr']
+        col_rows, col_weights = index['col_rows'], index['col_weights']
+        scores = np.zeros(len(recipes), dtype=np.float32)
+        for ingredient, weight in zip(index['ingredients'][start:end],
+                                      index['weights'][start:end]):
+            column = np.searchsorted(columns, ingredient)
+            begin, finish = col_ptr[column], col_ptr[column + 1]
+            scores[col_rows[begin:finish]] += (
+                col_weights[begin:finish] * weight
+            )
+        scores[row] = 0
+        limit = min(limit, len(recipes) - 1)
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(recipes[position]), float(scores[position]))
+                for position in top if scores[position] > 0]
+
+    def pantry(self, ingredient_ids, mask=0, match_all=False, limit=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает первые limit рецептов по убыванию доли имеющихся
+        ингредиентов, затем по возрастанию числа недостающих, затем
+        от новых к старым: массивы id, долей и недостающих, а также число
+        всех подходящих рецептов. С mask остаются рецепты с любым
+        из тегов маски, с match_all - со всеми. Полностью сортируются
+        только рецепты, которые могут попасть в первые limit.
+        """
+        index = self.get()
+        recipes, indptr = index['recipes'], index['indptr']
+        columns, col_ptr = index['columns'], index['col_ptr']
+        ingredient_ids = np.unique(np.array(ingredient_ids, dtype=np.int64))
+        positions = np.searchsorted(columns, ingredient_ids)
+        postings = [
+            index['col_rows'][col_ptr[position]:col_ptr[position + 1]]
+            for position, ingredient in zip(positions, ingredient_ids)
+            if position < len(columns) and columns[position] == ingredient
+        ]
+        if not postings:
+            return (np.array([], dtype=np.int64), np.array([]),
+                    np.array([], dtype=np.int64), 0)
+        # в списке ингредиента каждый рецепт встречается один раз
+        have = np.bincount(np.concatenate(postings), minlength=len(recipes))
+        rows = np.flatnonzero(have)
+        if mask:
+            bits = index['tags'][rows] & mask
+            rows = rows[bits == mask if match_all else bits != 0]
+        have = have[rows]
+        total = indptr[rows + 1] - indptr[rows]
+        coverage = have / total
+        count = len(rows)
+        if limit and limit < count:
+            # порог доли у limit-го рецепта; равные ему остаются,
+            # их порядок решает сортировка
+            threshold = np.partition(coverage, count - limit)[count - limit]
+            keep = coverage >= threshold
+            rows, total, coverage = rows[keep], total[keep], coverage[keep]
+            have = have[keep]
+        missing = total - have
+        recipe_ids = recipes[rows]
+        order = np.lexsort((-recipe_ids, missing, -coverage))[:limit]
+        return recipe_ids[order], coverage[order], missing[order], count
+
+
+similar_index = SimilarRecipesIndex()
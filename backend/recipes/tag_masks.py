@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .caching import get_version
+from .models import MAX_TAGS, Recipe, Tag
+
+
+def tags_mask(tags):
+    """Маска рецепта: по биту Tag.bit на каждый тег."""
+    mask = 0
+    for tag in tags:
+        mask |= 1 << tag.bit
+    return mask
+
+
+def get_tag_bits():
+    """{слаг: бит} всех тегов; кеш сбрасывается при изменении тегов."""
+    key = f'tag_bits:{get_version("tags")}'
+    bits = cache.get(key)
+    if bits is None:
+        bits = dict(Tag.objects.filter(bit__isnull=False).values_list(
+            'slug', 'bit'
+        ))
+        cache.set(key, bits, settings.REFERENCE_CACHE_TIMEOUT)
+    return bits
+
+
+def slugs_mask(slugs):
+    """Маска по слагам; неизвестные слаги в маску не попадают."""
+    bits = get_tag_bits()
+    mask = 0
+    for slug in slugs:
+        if slug in bits:
+            mask |= 1 << bits[slug]
+    return mask
+
+
+def match_mask(slugs, match_all=False):
+    """Маска фильтра по слагам или None, если подходящих рецептов нет.
+
+    Так бывает, когда все слаги неизвестны, а со всеми тегами
+    (match_all) - когда неизвестен хотя бы один.
+    """
+    mask = slugs_mask(slugs)
+    if not mask or match_all and len(set(slugs)) != bin(mask).count('1'):
+        return None
+    return mask
+
+
+def assign_tag_bits():
+    """Выдает свободные биты тегам без бита.
+
+    Теги из фикстур и bulk_create сохраняются без Tag.save(), поэтому
+    биты раздаются отдельно, после записи.
+    """
+    free = sorted(set(range(MAX_TAGS)) - set(Tag.objects.filter(
+        bit__isnull=False
+    ).values_list('bit', flat=True)), reverse=True)
+    for tag in Tag.objects.filter(bit__isnull=True).order_by('id'):
+        if not free:
+            raise ValueError(f'Тегов не может быть больше {MAX_TAGS}')
+        Tag.objects.filter(pk=tag.pk).update(bit=free.pop())
+
+
+def clear_tag_bit(bit):
+    """Убирает бит удаленного тега из масок рецептов."""
+    Recipe.objects.alias(
+        tag_bit=F('tags_mask').bitand(1 << bit)
+    ).exclude(tag_bit=0).update(
+        tags_mask=F('tags_mask').bitand(~(1 << bit))
+    )
+
+
+def get_actual_masks():
+    """Маски, посчитанные по таблице связей: {id рецепта: маска}."""
+    masks = {}
+    for recipe_id, bit in Recipe.tags.through.objects.filter(
+        tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit').iterator():
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bit
+    return masks
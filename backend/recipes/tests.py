@@ -1,3 +1,1840 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import os
+import posixpath
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient, APITestCase
+from users.models import Follow
+from users.serializers import UserTokenObtainPairSerializer
+
+from .benchmark import compare, run_benchmark
+from .images import (derivative_name, get_derivative_urls, is_hashed_name,
+                     store_recipe_image)
+from .ingredient_index import ingredient_index
+from .models import (Favorites, FeedEntry, Ingredient, IngredientForRecipe,
+                     Purchase, Recipe, ShoppingListLine, Tag,
+                     TrendingWatermark)
+from .shopping_list import add_to_shopping_list, apply_shopping_list_delta
+from .similarity import similar_index
+from .tag_masks import tags_mask
+from .trending import update_trending
+from .versioning import lock_recipe_version
+
+User = get_user_model()
+
+SMALL_GIF = base64.b64decode(
+    'R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw=='
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_recipe(author, name, ingredients=(), tags=()):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='Описание', cooking_time=10,
+        image=ContentFile(SMALL_GIF, name='small.gif'),
+        tags_mask=tags_mask(tags),
+    )
+    recipe.tags.set(tags)
+    IngredientForRecipe.objects.bulk_create(
+        IngredientForRecipe(recipe=recipe, ingredient=ingredient,
+                            amount=amount)
+        for ingredient, amount in ingredients
+    )
+    return recipe
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeListQueriesTest(APITestCase):
+    # count, recipes with authors, tags, ingredients
+    LIST_QUERIES = 4
+    # favorites, cart and follows when the relations cache is cold
+    RELATIONS_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@test.ru', password='pass',
+            first_name='Читатель', last_name='Читателев',
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@test.ru',
+                password='pass', first_name='Автор', last_name=str(i),
+            )
+            for i in range(3)
+        ]
+        Follow.objects.create(user=cls.user, author=authors[0])
+        for i in range(12):
+            recipe = create_recipe(
+                authors[i % 3], f'Рецепт {i}',
+                ingredients=[(ingr, i + 1) for ingr in cls.ingredients],
+                tags=cls.tags,
+            )
+            if i % 2:
+                Favorites.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                Purchase.objects.create(user=cls.user, recipe=recipe)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        url = reverse('recipes-list')
+        with self.assertNumQueries(self.LIST_QUERIES
+                                   + self.RELATIONS_QUERIES):
+            self.client.get(url)
+        for page_size in (2, 6, 12):
+            with mock.patch.object(PageNumberPagination, 'page_size',
+                                   page_size):
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_flags_match_user_relations(self):
+        response = self.client.get(reverse('recipes-list'), {'page': 1})
+        for item in response.data['results']:
+            recipe_id = item['id']
+            self.assertEqual(
+                item['is_favorited'],
+                Favorites.objects.filter(user=self.user,
+                                         recipe=recipe_id).exists()
+            )
+            self.assertEqual(
+                item['is_in_shopping_cart'],
+                Purchase.objects.filter(user=self.user,
+                                        recipe=recipe_id).exists()
+            )
+            self.assertEqual(
+                item['author']['is_subscribed'],
+                item['author']['username'] == 'author0'
+            )
+            self.assertEqual(len(item['ingredients']), 3)
+            self.assertEqual(len(item['tags']), 2)
+
+    def test_relations_cache_invalidated_on_change(self):
+        url = reverse('recipes-list')
+        self.client.get(url)
+        recipe = Recipe.objects.exclude(favorites__user=self.user).first()
+        detail_url = reverse('recipes-detail', args=[recipe.id])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Favorites.objects.create(user=self.user, recipe=recipe)
+        # версия меняется только после фиксации транзакции, иначе
+        # параллельный запрос закешировал бы старые связи под новой
+        self.assertFalse(self.client.get(detail_url).data['is_favorited'])
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.client.get(detail_url).data['is_favorited'])
+
+    def test_flag_filters(self):
+        response = self.client.get(
+            reverse('recipes-list'), {'is_favorited': 'true'}
+        )
+        self.assertEqual(response.data['count'], 6)
+        self.assertTrue(
+            all(item['is_favorited'] for item in response.data['results'])
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DownloadShoppingCartTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@test.ru', password='pass',
+            first_name='Покупатель', last_name='Покупателев',
+        )
+        sugar = Ingredient.objects.create(name='сахар', measurement_unit='г')
+        sugar_spoon = Ingredient.objects.create(name='сахар',
+                                                measurement_unit='ст. л.')
+        milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        first = create_recipe(cls.user, 'Каша',
+                              ingredients=[(sugar, 10), (milk, 200)])
+        second = create_recipe(cls.user, 'Чай',
+                               ingredients=[(sugar, 5), (sugar_spoon, 2)])
+        create_recipe(cls.user, 'Не в корзине', ingredients=[(milk, 1000)])
+        for recipe in (first, second):
+            Purchase.objects.create(user=cls.user, recipe=recipe)
+            add_to_shopping_list(cls.user, recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('download_shopping_cart')
+
+    def test_txt_sums_by_name_and_unit(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            content,
+            'молоко - 200, мл\nсахар - 15, г\nсахар - 2, ст. л.\n'
+        )
+        self.assertIn('shopping_list.txt', response['Content-Disposition'])
+
+    def test_csv(self):
+        response = self.client.get(self.url, {'file_format': 'csv'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(content.splitlines()[1:],
+                         ['молоко,200,мл', 'сахар,15,г', 'сахар,2,ст. л.'])
+
+    def test_pdf(self):
+        response = self.client.get(self.url, {'file_format': 'pdf'})
+        content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_unknown_format(self):
+        response = self.client.get(self.url, {'file_format': 'xls'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ShoppingListLineTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='pass',
+            first_name='Повар', last_name='Поваров',
+        )
+        cls.buyers = [
+            User.objects.create_user(
+                username=f'buyer{i}', email=f'buyer{i}@test.ru',
+                password='pass', first_name='Покупатель', last_name=str(i),
+            )
+            for i in range(2)
+        ]
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.flour = Ingredient.objects.create(name='мука',
+                                              measurement_unit='г')
+        cls.egg = Ingredient.objects.create(name='яйцо',
+                                            measurement_unit='шт')
+        cls.salt = Ingredient.objects.create(name='соль',
+                                             measurement_unit='г')
+        cls.pancakes = create_recipe(
+            cls.author, 'Блины', ingredients=[(cls.flour, 200), (cls.egg, 2)],
+            tags=[cls.tag],
+        )
+        cls.bread = create_recipe(
+            cls.author, 'Хлеб', ingredients=[(cls.flour, 500)],
+            tags=[cls.tag],
+        )
+
+    def lines(self, user):
+        return dict(
+            ShoppingListLine.objects.filter(user=user).values_list(
+                'ingredient__name', 'total_amount'
+            )
+        )
+
+    def add_to_cart(self, user, recipe):
+        self.client.force_authenticate(user)
+        response = self.client.get(
+            reverse('shopping_cart', args=[recipe.id])
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_cart_add_and_remove(self):
+        buyer = self.buyers[0]
+        self.add_to_cart(buyer, self.pancakes)
+        self.add_to_cart(buyer, self.bread)
+        self.assertEqual(self.lines(buyer), {'мука': 700, 'яйцо': 2})
+        response = self.client.delete(
+            reverse('shopping_cart', args=[self.pancakes.id])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.lines(buyer), {'мука': 500})
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def test_delta_adds_to_line_created_concurrently(self):
+        buyer = self.buyers[0]
+        # строку уже вставила параллельная корзина, пока эта считала delta
+        ShoppingListLine.objects.create(user=buyer, ingredient=self.flour,
+                                        total_amount=500)
+        apply_shopping_list_delta([buyer.id], {self.flour.id: 200,
+                                               self.egg.id: 2,
+                                               self.salt.id: -5})
+        self.assertEqual(self.lines(buyer), {'мука': 700, 'яйцо': 2})
+
+    def test_recipe_update_changes_carts(self):
+        for buyer in self.buyers:
+            self.add_to_cart(buyer, self.pancakes)
+        self.client.force_authenticate(self.author)
+        response = self.client.put(
+            reverse('recipes-detail', args=[self.pancakes.id]),
+            {
+                'name': 'Блины',
+                'text': 'Тонкие',
+                'cooking_time': 20,
+                'tags': [self.tag.id],
+                'image': 'data:image/gif;base64,'
+                         + base64.b64encode(SMALL_GIF).decode(),
+                'ingredients': [
+                    {'id': self.flour.id, 'amount': 250},
+                    {'id': self.salt.id, 'amount': 5},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        for buyer in self.buyers:
+            self.assertEqual(self.lines(buyer), {'мука': 250, 'соль': 5})
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def test_recipe_delete_changes_carts(self):
+        buyer = self.buyers[0]
+        self.add_to_cart(buyer, self.pancakes)
+        self.add_to_cart(buyer, self.bread)
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(
+            reverse('recipes-detail', args=[self.pancakes.id])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.lines(buyer), {'мука': 500})
+
+    def test_admin_changes_carts(self):
+        buyer = self.buyers[0]
+        self.add_to_cart(buyer, self.pancakes)
+        self.add_to_cart(buyer, self.bread)
+        self.client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@test.ru', password='pass',
+        ))
+        row = IngredientForRecipe.objects.get(recipe=self.pancakes,
+                                              ingredient=self.egg)
+        response = self.client.post(
+            reverse('admin:recipes_ingredientforrecipe_change',
+                    args=[row.id]),
+            {'recipe': self.pancakes.id, 'ingredient': self.salt.id,
+             'amount': 3},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.lines(buyer), {'мука': 700, 'соль': 3})
+        response = self.client.post(
+            reverse('admin:recipes_recipe_delete', args=[self.pancakes.id]),
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.lines(buyer), {'мука': 500})
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def test_author_delete_changes_carts(self):
+        buyer = self.buyers[0]
+        self.add_to_cart(buyer, self.pancakes)
+        self.author.delete()
+        self.assertEqual(self.lines(buyer), {})
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def test_rebuild_repairs_drift(self):
+        buyer = self.buyers[0]
+        self.add_to_cart(buyer, self.pancakes)
+        ShoppingListLine.objects.filter(ingredient=self.egg).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', check=True,
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(self.lines(buyer), {'мука': 200, 'яйцо': 2})
+
+
+class IngredientSearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, unit in (('Мука', 'г'), ('мука пшеничная', 'г'),
+                           ('мускатный орех', 'г'), ('Мука', 'ст. л.'),
+                           ('молоко', 'мл'), ('мёд', 'г')):
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+
+    def setUp(self):
+        ingredient_index.build()
+        self.url = reverse('ingredients-list')
+
+    def names(self, response):
+        return [(item['name'], item['measurement_unit'])
+                for item in response.data]
+
+    def test_prefix_search_is_case_insensitive_and_ranked(self):
+        response = self.client.get(self.url, {'name': 'МУК'})
+        self.assertEqual(self.names(response), [
+            ('Мука', 'г'), ('Мука', 'ст. л.'), ('мука пшеничная', 'г'),
+        ])
+
+    def test_search_is_served_from_memory(self):
+        self.client.get(self.url, {'name': 'м'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'name': 'му'})
+        self.assertEqual(len(response.data), 4)
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_limit(self):
+        response = self.client.get(self.url, {'name': 'м'})
+        self.assertEqual(len(response.data), 2)
+
+    def test_index_invalidated_on_save_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            salt = Ingredient.objects.create(name='соль',
+                                             measurement_unit='г')
+        with mock.patch('recipes.ingredient_index.threading.Thread') as thread:
+            response = self.client.get(self.url, {'name': 'со'})
+            self.assertEqual(response.data, [])
+            self.client.get(self.url, {'name': 'со'})
+        # пока идет перестройка, запросы отвечают по старому индексу
+        # и не запускают вторую
+        thread.assert_called_once_with(target=ingredient_index.rebuild,
+                                       daemon=True)
+        with mock.patch('recipes.ingredient_index.connections'):
+            ingredient_index.rebuild()
+        response = self.client.get(self.url, {'name': 'со'})
+        self.assertEqual(self.names(response), [('соль', 'г')])
+        salt.delete()
+        ingredient_index.build()
+        response = self.client.get(self.url, {'name': 'со'})
+        self.assertEqual(response.data, [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeSearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='chef', email='chef@test.ru', password='pass',
+            first_name='Шеф', last_name='Шефов',
+        )
+        cls.soup = Tag.objects.create(name='Супы', color='#FF0000',
+                                      slug='soup')
+        cls.borsch = create_recipe(author, 'Борщ с говядиной',
+                                   tags=[cls.soup])
+        cls.salad = create_recipe(author, 'Винегрет', tags=[])
+        cls.salad.text = 'Салат со свеклой, почти как борщ'
+        cls.salad.save()
+        create_recipe(author, 'Сырники', tags=[cls.soup])
+
+    def search(self, **params):
+        response = self.client.get(reverse('recipes-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_name_matches_rank_above_text_matches(self):
+        self.assertEqual(self.search(search='борщ'),
+                         ['Борщ с говядиной', 'Винегрет'])
+
+    def test_search_in_text_follows_updates(self):
+        self.assertEqual(self.search(search='свекл'), ['Винегрет'])
+        self.salad.text = 'Салат'
+        self.salad.save()
+        self.assertEqual(self.search(search='свекл'), [])
+
+    def test_search_composes_with_tag_filter(self):
+        self.assertEqual(self.search(search='борщ', tags='soup'),
+                         ['Борщ с говядиной'])
+
+    def test_search_is_not_paginated_by_cursor(self):
+        response = self.client.get(reverse('recipes-list'),
+                                   {'search': 'борщ', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pagination', response.data)
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search(search='"борщ OR ('), [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeCursorPaginationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'writer{i}', email=f'writer{i}@test.ru',
+                password='pass', first_name='Автор', last_name=str(i),
+            )
+            for i in range(2)
+        ]
+        for i in range(15):
+            create_recipe(cls.authors[i % 2], f'Рецепт {i}')
+        # одинаковое время публикации: порядок должен держаться на id
+        Recipe.objects.update(pub_date=Recipe.objects.first().pub_date)
+
+    def walk(self, params):
+        names, url = [], reverse('recipes-list')
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            names += [item['name'] for item in response.data['results']]
+            url, params = response.data['next'], None
+        return names
+
+    def test_walks_feed_in_model_ordering(self):
+        expected = list(Recipe.objects.values_list('name', flat=True))
+        self.assertEqual(self.walk({'pagination': 'cursor'}), expected)
+
+    def test_respects_filters(self):
+        author = self.authors[0]
+        expected = list(
+            Recipe.objects.filter(author=author).values_list('name',
+                                                             flat=True)
+        )
+        self.assertEqual(
+            self.walk({'pagination': 'cursor', 'author': author.id}),
+            expected
+        )
+
+    def test_approximate_count(self):
+        response = self.client.get(reverse('recipes-list'),
+                                   {'pagination': 'cursor'})
+        self.assertEqual(response.data['approximate_count'], 15)
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(reverse('recipes-list'))
+        self.assertEqual(response.data['count'], 15)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CountersTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='baker', email='baker@test.ru', password='pass',
+            first_name='Пекарь', last_name='Пекарев',
+        )
+        cls.reader = User.objects.create_user(
+            username='eater', email='eater@test.ru', password='pass',
+            first_name='Едок', last_name='Едоков',
+        )
+        cls.tag = Tag.objects.create(name='Выпечка', color='#AA0000',
+                                     slug='bakery')
+        cls.flour = Ingredient.objects.create(name='мука',
+                                              measurement_unit='г')
+
+    def create_via_api(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(reverse('recipes-list'), {
+            'name': 'Пирог',
+            'text': 'С яблоками',
+            'cooking_time': 60,
+            'tags': [self.tag.id],
+            'image': 'data:image/gif;base64,'
+                     + base64.b64encode(SMALL_GIF).decode(),
+            'ingredients': [{'id': self.flour.id, 'amount': 300}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def test_counters_follow_writes(self):
+        recipe = self.create_via_api()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.client.force_authenticate(self.reader)
+        self.client.get(reverse('recipes-favorite', args=[recipe.id]))
+        self.client.get(reverse('shopping_cart', args=[recipe.id]))
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1)
+        )
+        self.client.delete(reverse('recipes-favorite', args=[recipe.id]))
+        self.client.delete(reverse('shopping_cart', args=[recipe.id]))
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (0, 0)
+        )
+        call_command('reconcile_counters', check=True, stdout=StringIO())
+        self.client.force_authenticate(self.author)
+        self.client.delete(reverse('recipes-detail', args=[recipe.id]))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_cascade_and_admin_deletes_keep_counters(self):
+        recipe = self.create_via_api()
+        self.client.force_authenticate(self.reader)
+        self.client.get(reverse('recipes-favorite', args=[recipe.id]))
+        self.client.get(reverse('shopping_cart', args=[recipe.id]))
+        self.client.get(reverse('customuser-subscribe',
+                                args=[self.author.id]))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@test.ru', password='pass',
+        ))
+        favorite = Favorites.objects.get(recipe=recipe)
+        response = self.client.post(
+            reverse('admin:recipes_favorites_delete', args=[favorite.id]),
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.reader.delete()
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.in_carts_count, 0)
+        self.assertEqual(self.author.followers_count, 0)
+        recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+        call_command('reconcile_counters', check=True, stdout=StringIO())
+
+    def test_reconcile_repairs_drift(self):
+        recipe = create_recipe(self.author, 'Кекс')
+        Favorites.objects.create(user=self.reader, recipe=recipe)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', check=True,
+                         stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            call_command('reconcile_counters', stdout=StringIO())
+        updates = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        # пересчитываются только favorites_count рецепта и recipes_count
+        # автора, и только в разошедшихся строках
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(all(' IN (' in sql for sql in updates))
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+
+
+class ReferenceDataCacheTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', color='#E26C2D',
+                           slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_hit_does_not_touch_database(self):
+        url = reverse('tags-list')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(json.loads(second.content)[0]['slug'], 'breakfast')
+        self.assertTrue(second['ETag'].startswith('"'))
+
+    def test_if_none_match_returns_304(self):
+        url = reverse('ingredients-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_gzip(self):
+        url = reverse('ingredients-list')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)),
+                         json.loads(self.client.get(url).content))
+
+    def test_gzip_refused_or_not_listed(self):
+        url = reverse('ingredients-list')
+        for header in ('gzip;q=0, br', 'identity', 'br, *;q=0',
+                       'notgzip, deflate', '*, gzip; q=0.0'):
+            with self.subTest(header=header):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING=header)
+                self.assertFalse(response.has_header('Content-Encoding'))
+        for header in ('GZIP;q=0.5', 'br, *'):
+            with self.subTest(header=header):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_changes_bump_version(self):
+        url = reverse('tags-list')
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        # до фиксации транзакции версия прежняя
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+        for callback in callbacks:
+            callback()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+    def test_unused_query_params_share_cache_entry(self):
+        url = reverse('ingredients-list')
+        self.client.get(url, {'x': 1})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'x': 2})
+        self.assertEqual(len([
+            key for key in cache._cache if ':response:ingredients:' in key
+        ]), 1)
+
+
+def make_png(width, height, color=(200, 100, 50)):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   RECIPE_IMAGE_SIZES={'card': (100, 100),
+                                       'detail': (300, 300)})
+class RecipeImageTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='painter', email='painter@test.ru', password='pass',
+            first_name='Художник', last_name='Художников',
+        )
+        cls.tag = Tag.objects.create(name='Десерт', color='#FFAA00',
+                                     slug='dessert')
+        cls.sugar = Ingredient.objects.create(name='сахар',
+                                              measurement_unit='г')
+
+    def post_base64(self, name, image):
+        self.client.force_authenticate(self.author)
+        return self.client.post(reverse('recipes-list'), {
+            'name': name,
+            'text': 'Сладко',
+            'cooking_time': 15,
+            'tags': [self.tag.id],
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(image).decode(),
+            'ingredients': [{'id': self.sugar.id, 'amount': 10}],
+        }, format='json')
+
+    def post_recipe(self, name, image):
+        response = self.post_base64(name, image)
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def test_derivatives_are_built(self):
+        recipe = self.post_recipe('Торт', make_png(800, 400))
+        self.assertTrue(is_hashed_name(recipe.image.name))
+        for size, max_size in (('card', 100), ('detail', 300)):
+            for image_format in ('webp', 'jpeg'):
+                name = derivative_name(recipe.image.name, size, image_format)
+                with default_storage.open(name) as file:
+                    image = Image.open(file)
+                    self.assertEqual(image.format, image_format.upper())
+                    self.assertEqual(image.size, (max_size, max_size // 2))
+        response = self.client.get(reverse('recipes-detail',
+                                           args=[recipe.id]))
+        self.assertTrue(
+            response.data['images']['card']['webp'].endswith('/card.webp')
+        )
+
+    def test_same_image_is_stored_once(self):
+        image = make_png(50, 50)
+        first = self.post_recipe('Пирожное', image)
+        second = self.post_recipe('Эклер', image)
+        self.assertEqual(first.image.name, second.image.name)
+
+    def test_concurrent_store_keeps_hashed_name(self):
+        image = ContentFile(make_png(40, 40))
+        name = store_recipe_image(image)
+        directory = posixpath.dirname(name)
+        files = default_storage.listdir(directory)[1]
+        exists = default_storage.exists
+        checked = set()
+
+        def not_yet_saved(path):
+            # параллельный запрос проверил имя до того, как файл записали
+            if path in checked:
+                return exists(path)
+            checked.add(path)
+            return False
+        with mock.patch.object(default_storage, 'exists',
+                               side_effect=not_yet_saved):
+            self.assertEqual(store_recipe_image(image), name)
+        self.assertEqual(default_storage.listdir(directory)[1], files)
+
+    def test_legacy_images_are_converted(self):
+        recipe = create_recipe(self.author, 'Старый рецепт')
+        self.assertFalse(is_hashed_name(recipe.image.name))
+        urls = get_derivative_urls(recipe.image.name)
+        self.assertEqual(urls['card']['webp'], recipe.image.url)
+        call_command('build_image_derivatives', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.assertTrue(is_hashed_name(recipe.image.name))
+        self.assertTrue(default_storage.exists(
+            derivative_name(recipe.image.name, 'card', 'webp')
+        ))
+
+    def post_multipart(self, name, image):
+        self.client.force_authenticate(self.author)
+        upload = SimpleUploadedFile('photo.png', image,
+                                    content_type='image/png')
+        return self.client.post(reverse('recipes-list'), {
+            'name': name,
+            'text': 'Сладко',
+            'cooking_time': 15,
+            'tags': [self.tag.id],
+            'image': upload,
+            'ingredients[0]id': self.sugar.id,
+            'ingredients[0]amount': 10,
+        }, format='multipart')
+
+    def test_multipart_upload(self):
+        response = self.post_multipart('Безе', make_png(200, 100))
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertTrue(is_hashed_name(recipe.image.name))
+        self.assertEqual(recipe.ingredients.get(), self.sugar)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1024)
+    def test_upload_size_limit(self):
+        buffer = BytesIO()
+        Image.effect_noise((300, 300), 100).save(buffer, 'PNG')
+        response = self.post_multipart('Зефир', buffer.getvalue())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_DIMENSION=100)
+    def test_upload_dimension_limit(self):
+        for post in (self.post_multipart, self.post_base64):
+            response = post('Пастила', make_png(400, 50))
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('image', response.data)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, RECIPE_BULK_BATCH_SIZE=2)
+class BulkImportTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='importer', email='importer@test.ru', password='pass',
+            first_name='Импорт', last_name='Импортов',
+        )
+        cls.tag = Tag.objects.create(name='Суп', color='#00AAFF',
+                                     slug='soup')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'овощ {i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        create_recipe(cls.author, 'Борщ')
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+        self.url = reverse('recipes-bulk')
+
+    def make_item(self, name, ingredient_ids=None, tags=None):
+        if ingredient_ids is None:
+            ingredient_ids = [item.id for item in self.ingredients]
+        return {
+            'name': name,
+            'text': 'Импортированный рецепт',
+            'cooking_time': 30,
+            'tags': tags or [self.tag.id],
+            'image': 'data:image/gif;base64,'
+                     + base64.b64encode(SMALL_GIF).decode(),
+            'ingredients': [
+                {'id': ingredient_id, 'amount': 100}
+                for ingredient_id in ingredient_ids
+            ],
+        }
+
+    def test_bulk_import_with_per_item_errors(self):
+        items = [
+            self.make_item('Щи'),
+            self.make_item('Борщ'),
+            self.make_item('Рассольник', [self.ingredients[0].id] * 2),
+            self.make_item('Солянка', [0]),
+            self.make_item('Уха', tags=[0]),
+            {'name': 'Окрошка'},
+            self.make_item('Щи'),
+            self.make_item('Харчо'),
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [error['index'] for error in response.data['errors']],
+            [1, 2, 3, 4, 5, 6]
+        )
+        self.assertEqual(len(response.data['created']), 2)
+        recipe = Recipe.objects.get(name='Харчо')
+        self.assertEqual(recipe.ingredients.count(), 3)
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+
+    def test_batch_queries_do_not_depend_on_ingredients(self):
+        items = [self.make_item(f'Суп {i}') for i in range(2)]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, items, format='json')
+        ingredient_queries = [
+            query for query in queries
+            if 'FROM "recipes_ingredient"' in query['sql']
+        ]
+        self.assertEqual(len(ingredient_queries), 1)
+
+    def test_ndjson_and_command(self):
+        lines = '\n'.join(
+            json.dumps(self.make_item(f'Бульон {i}')) for i in range(3)
+        )
+        response = self.client.post(
+            self.url, lines.encode(), content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 3)
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(json.dumps(self.make_item('Гаспачо')) + '\n\n')
+            file.write(json.dumps(self.make_item('Бульон 0')) + '\n')
+            file.flush()
+            stderr = StringIO()
+            call_command('import_recipes', file.name, author='importer',
+                         stdout=StringIO(), stderr=stderr)
+        self.assertTrue(Recipe.objects.filter(name='Гаспачо').exists())
+        self.assertIn('Рецепт 1', stderr.getvalue())
+
+    def test_not_a_list(self):
+        response = self.client.post(self.url, {'name': 'Щи'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TagFilterTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='pass',
+            first_name='Повар', last_name='Поваров',
+        )
+        cls.breakfast, cls.lunch, cls.dinner = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+                ('Ужин', '#8775D2', 'dinner'),
+            )
+        ]
+        create_recipe(cls.author, 'Омлет', tags=[cls.breakfast])
+        create_recipe(cls.author, 'Суп', tags=[cls.lunch, cls.dinner])
+        create_recipe(cls.author, 'Каша',
+                      tags=[cls.breakfast, cls.lunch, cls.dinner])
+        create_recipe(cls.author, 'Компот')
+
+    def setUp(self):
+        # карта слагов кешируется по версии тегов, а откат транзакции
+        # теста кеш не откатывает
+        cache.clear()
+
+    def names(self, **params):
+        response = self.client.get(reverse('recipes-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(item['name'] for item in response.data['results'])
+
+    def test_tags_get_distinct_bits(self):
+        bits = Tag.objects.values_list('bit', flat=True)
+        self.assertNotIn(None, bits)
+        self.assertEqual(len(set(bits)), 3)
+
+    def test_any_of_tags(self):
+        self.assertEqual(self.names(tags=['breakfast', 'dinner']),
+                         ['Каша', 'Омлет', 'Суп'])
+        self.assertEqual(self.names(tags=['unknown']), [])
+        self.assertEqual(len(self.names()), 4)
+
+    def test_all_of_tags(self):
+        self.assertEqual(
+            self.names(tags=['lunch', 'dinner'], tags_match='all'),
+            ['Каша', 'Суп']
+        )
+        self.assertEqual(
+            self.names(tags=['lunch', 'unknown'], tags_match='all'), []
+        )
+
+    def test_filter_does_not_join_tags(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.names(tags=['breakfast', 'lunch', 'dinner'])
+        recipe_queries = [query['sql'] for query in queries
+                          if 'FROM "recipes_recipe"' in query['sql']]
+        self.assertTrue(recipe_queries)
+        for sql in recipe_queries:
+            self.assertNotIn('recipes_recipe_tags', sql)
+            self.assertNotIn('DISTINCT', sql)
+
+    def test_mask_follows_api_writes(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(reverse('recipes-list'), {
+            'name': 'Блины',
+            'text': 'Тонкие',
+            'cooking_time': 30,
+            'tags': [self.breakfast.id],
+            'image': 'data:image/gif;base64,'
+                     + base64.b64encode(SMALL_GIF).decode(),
+            'ingredients': [],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        url = reverse('recipes-detail', args=[response.data['id']])
+        self.assertIn('Блины', self.names(tags=['breakfast']))
+        response = self.client.patch(url, {'tags': [self.dinner.id]},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Блины', self.names(tags=['breakfast']))
+        self.assertIn('Блины', self.names(tags=['dinner']))
+        call_command('reconcile_tag_masks', check=True, stdout=StringIO())
+        recipe = Recipe.objects.get(name='Блины')
+        self.assertEqual(recipe.tags_mask, tags_mask([self.dinner]))
+
+    def test_deleted_tag_bit_is_released(self):
+        bit = self.dinner.bit
+        self.dinner.delete()
+        self.assertEqual(self.names(tags=['lunch'], tags_match='all'),
+                         ['Каша', 'Суп'])
+        self.assertFalse(Recipe.objects.alias(
+            tag_bit=F('tags_mask').bitand(1 << bit)
+        ).exclude(tag_bit=0).exists())
+        supper = Tag.objects.create(name='Поздний ужин', color='#000000',
+                                    slug='supper')
+        self.assertEqual(supper.bit, bit)
+        self.assertEqual(self.names(tags=['supper']), [])
+
+    def test_reconcile_repairs_masks(self):
+        Recipe.objects.filter(name='Суп').update(tags_mask=0)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_tag_masks', check=True,
+                         stdout=StringIO())
+        call_command('reconcile_tag_masks', stdout=StringIO())
+        self.assertEqual(self.names(tags=['lunch']), ['Каша', 'Суп'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   SIMILAR_INDEX_DIR=os.path.join(TEMP_MEDIA_ROOT, 'similar'))
+class SimilarRecipesTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='taster', email='taster@test.ru', password='pass',
+            first_name='Дегустатор', last_name='Дегустаторов',
+        )
+        salt, water, beet, cabbage, cheese, flour = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'вода', 'свекла', 'капуста', 'творог',
+                         'мука')
+        ]
+        cls.salt, cls.cabbage = salt, cabbage
+        cls.borsch = create_recipe(cls.author, 'Борщ', ingredients=[
+            (salt, 5), (water, 1000), (beet, 300), (cabbage, 200)
+        ])
+        cls.vinaigrette = create_recipe(cls.author, 'Винегрет', ingredients=[
+            (salt, 3), (beet, 200), (cabbage, 100)
+        ])
+        cls.soup = create_recipe(cls.author, 'Суп', ingredients=[
+            (salt, 5), (water, 1000)
+        ])
+        cls.syrniki = create_recipe(cls.author, 'Сырники', ingredients=[
+            (cheese, 400), (flour, 50)
+        ])
+
+    def setUp(self):
+        shutil.rmtree(settings.SIMILAR_INDEX_DIR, ignore_errors=True)
+        # фоновое обновление не видит данных незакрытой транзакции теста,
+        # поэтому тесты применяют изменения сами через update()
+        patcher = mock.patch('recipes.similarity.threading.Thread')
+        self.thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def similar(self, recipe, **params):
+        response = self.client.get(
+            reverse('recipes-similar', args=[recipe.id]), params
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_rare_shared_ingredients_rank_higher(self):
+        self.assertEqual(self.similar(self.borsch), ['Винегрет', 'Суп'])
+        self.assertEqual(self.similar(self.borsch, limit=1), ['Винегрет'])
+        self.assertEqual(self.similar(self.syrniki), [])
+        response = self.client.get(
+            reverse('recipes-similar', args=[self.soup.id])
+        )
+        self.assertEqual(response.data[0]['name'], 'Борщ')
+        self.assertTrue(0 < response.data[0]['similarity'] <= 1)
+
+    def test_errors(self):
+        url = reverse('recipes-similar', args=[self.borsch.id])
+        self.assertEqual(self.client.get(url, {'limit': 'x'}).status_code,
+                         400)
+        missing = reverse('recipes-similar', args=[self.syrniki.id + 100])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        invalid = reverse('recipes-similar', args=['abc'])
+        self.assertEqual(self.client.get(invalid).status_code, 404)
+
+    def test_index_follows_writes(self):
+        self.similar(self.borsch)
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('recipes-list'), {
+                'name': 'Щи',
+                'text': 'Кислые',
+                'cooking_time': 90,
+                'tags': [],
+                'image': 'data:image/gif;base64,'
+                         + base64.b64encode(SMALL_GIF).decode(),
+                'ingredients': [{'id': self.cabbage.id, 'amount': 500},
+                                {'id': self.salt.id, 'amount': 5}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        # до обновления запрос отвечает по прежней сборке
+        self.assertNotIn('Щи', self.similar(self.vinaigrette))
+        self.thread.assert_called_once_with(
+            target=similar_index.update_in_background, daemon=True
+        )
+        similar_index.update()
+        self.assertIn('Щи', self.similar(self.vinaigrette))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(
+                reverse('recipes-detail', args=[self.vinaigrette.id])
+            )
+        similar_index.update()
+        self.assertNotIn('Винегрет', self.similar(self.borsch))
+        index = similar_index.load()
+        for position, recipe_id in enumerate(index['recipes']):
+            start, end = index['indptr'][position:position + 2]
+            self.assertEqual(
+                set(index['ingredients'][start:end].tolist()),
+                set(IngredientForRecipe.objects.filter(
+                    recipe_id=recipe_id
+                ).values_list('ingredient_id', flat=True))
+            )
+        call_command('build_similar_index', stdout=StringIO())
+        self.assertEqual(set(self.similar(self.borsch)), {'Щи', 'Суп'})
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   SIMILAR_INDEX_DIR=os.path.join(TEMP_MEDIA_ROOT, 'similar'))
+class PantryTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@test.ru', password='pass',
+            first_name='Повар', last_name='Поваров',
+        )
+        cls.egg, cls.milk, cls.flour, cls.sugar = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('яйцо', 'молоко', 'мука', 'сахар')
+        ]
+        cls.breakfast = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                           slug='breakfast')
+        cls.sweet = Tag.objects.create(name='Сладкое', color='#8775D2',
+                                       slug='sweet')
+        cls.omelet = create_recipe(cls.author, 'Омлет', ingredients=[
+            (cls.egg, 100), (cls.milk, 50)
+        ], tags=[cls.breakfast])
+        cls.pancakes = create_recipe(cls.author, 'Блины', ingredients=[
+            (cls.egg, 100), (cls.milk, 500), (cls.flour, 200),
+            (cls.sugar, 20)
+        ], tags=[cls.breakfast, cls.sweet])
+        cls.cake = create_recipe(cls.author, 'Бисквит', ingredients=[
+            (cls.egg, 200), (cls.flour, 150), (cls.sugar, 150)
+        ], tags=[cls.sweet])
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(settings.SIMILAR_INDEX_DIR, ignore_errors=True)
+        patcher = mock.patch('recipes.similarity.threading.Thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pantry(self, ingredients, **params):
+        response = self.client.post(
+            reverse('recipes-pantry') + '?' + urlencode(params, doseq=True),
+            {'ingredients': [ingredient.id for ingredient in ingredients]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(item['name'], item['coverage'], item['missing'])
+                for item in response.data['results']]
+
+    def test_ranked_by_coverage_then_missing(self):
+        self.assertEqual(self.pantry([self.egg, self.milk]), [
+            ('Омлет', 1.0, 0), ('Блины', 0.5, 2), ('Бисквит', 0.3333, 2),
+        ])
+        self.assertEqual(self.pantry([self.flour, self.sugar]), [
+            ('Бисквит', 0.6667, 1), ('Блины', 0.5, 2),
+        ])
+        response = self.client.post(reverse('recipes-pantry'),
+                                    {'ingredients': [self.egg.id]},
+                                    format='json')
+        self.assertEqual(response.data['count'], 3)
+        self.assertIsNone(response.data['next'])
+
+    def test_tags_filter(self):
+        egg = [self.egg]
+        self.assertEqual(
+            [name for name, *_ in self.pantry(egg, tags='sweet')],
+            ['Бисквит', 'Блины']
+        )
+        self.assertEqual(
+            [name for name, *_ in self.pantry(
+                egg, tags=['sweet', 'breakfast'], tags_match='all'
+            )],
+            ['Блины']
+        )
+        self.assertEqual(
+            self.pantry(egg, tags=['sweet', 'unknown'], tags_match='all'),
+            []
+        )
+
+    def test_errors(self):
+        url = reverse('recipes-pantry')
+        for data in ({}, {'ingredients': []}, {'ingredients': ['x']},
+                     {'ingredients': list(range(1, 200))}):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(url + '?tags_match=some',
+                                    {'ingredients': [self.egg.id]},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.pantry([Ingredient(id=self.sugar.id + 100)]), []
+        )
+        # курсор у подбора не поддерживается, страницы остаются номерными
+        self.assertEqual(len(self.pantry([self.egg], pagination='cursor')),
+                         3)
+
+    def test_index_follows_tag_changes(self):
+        self.assertEqual(len(self.pantry([self.egg], tags='sweet')), 2)
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('recipes-detail', args=[self.cake.id]),
+                {'tags': [self.breakfast.id]}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        similar_index.update()
+        self.assertEqual(
+            [name for name, *_ in self.pantry([self.egg], tags='sweet')],
+            ['Блины']
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.breakfast.delete()
+        self.assertTrue(os.path.exists(similar_index.file('stale')))
+        similar_index.update()
+        self.assertFalse(os.path.exists(similar_index.file('stale')))
+        self.assertEqual(self.pantry([self.egg], tags='breakfast'), [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RecipeUpdateTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='editor', email='editor@test.ru', password='pass',
+            first_name='Редактор', last_name='Редакторов',
+        )
+        cls.buyer = User.objects.create_user(
+            username='shopper', email='shopper@test.ru', password='pass',
+            first_name='Покупатель', last_name='Покупателев',
+        )
+        cls.tag = Tag.objects.create(name='Ужин', color='#8775D2',
+                                     slug='dinner')
+        cls.rice, cls.fish, cls.nori = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('рис', 'рыба', 'нори')
+        ]
+
+    def setUp(self):
+        self.recipe = create_recipe(
+            self.author, 'Роллы', tags=[self.tag],
+            ingredients=[(self.rice, 200), (self.fish, 100)],
+        )
+        Purchase.objects.create(user=self.buyer, recipe=self.recipe)
+        add_to_shopping_list(self.buyer, self.recipe)
+        self.client.force_authenticate(self.author)
+        self.url = reverse('recipes-detail', args=[self.recipe.id])
+
+    def test_text_change_does_not_touch_ingredients(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, {'text': 'Новый текст'},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([
+            query for query in queries
+            if 'recipes_ingredientforrecipe' in query['sql']
+            and query['sql'].startswith(('INSERT', 'DELETE', 'UPDATE'))
+        ])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Новый текст')
+        self.assertEqual(self.recipe.version, 2)
+
+    def test_ingredient_diff(self):
+        rice_row = IngredientForRecipe.objects.get(recipe=self.recipe,
+                                                   ingredient=self.rice)
+        response = self.client.patch(self.url, {'ingredients': [
+            {'id': self.rice.id, 'amount': 300},
+            {'id': self.nori.id, 'amount': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        rows = dict(IngredientForRecipe.objects.filter(
+            recipe=self.recipe
+        ).values_list('ingredient', 'amount'))
+        self.assertEqual(rows, {self.rice.id: 300, self.nori.id: 5})
+        rice_row.refresh_from_db()
+        self.assertEqual(rice_row.amount, 300)
+        self.assertEqual(dict(self.buyer.shopping_list.values_list(
+            'ingredient', 'total_amount'
+        )), {self.rice.id: 300, self.nori.id: 5})
+
+    def test_concurrent_edit_before_lock(self):
+        # состав рецепта меняется после prefetch, но до блокировки
+        def concurrent_edit(recipe, request):
+            IngredientForRecipe.objects.filter(
+                recipe=self.recipe, ingredient=self.fish
+            ).update(amount=150)
+            apply_shopping_list_delta([self.buyer.id], {self.fish.id: 50})
+            lock_recipe_version(recipe, request)
+
+        with mock.patch('recipes.views.lock_recipe_version',
+                        side_effect=concurrent_edit):
+            response = self.client.patch(self.url, {'ingredients': [
+                {'id': self.rice.id, 'amount': 300},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(self.buyer.shopping_list.values_list(
+            'ingredient', 'total_amount'
+        )), {self.rice.id: 300})
+
+    def test_jwt_permission_check_skips_user_queries(self):
+        token = UserTokenObtainPairSerializer.get_token(self.buyer)
+        self.client.force_authenticate(None)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {token.access_token}'
+        )
+        cache.clear()
+        # избранное, корзина и подписки при холодном кеше, рецепт, теги
+        # и состав; is_superuser берется из токена
+        with self.assertNumQueries(6):
+            response = self.client.patch(self.url, {'text': 'Чужая правка'},
+                                         format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_if_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(self.url, {'text': 'Первая правка'},
+                                     format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.patch(self.url, {'text': 'Вторая правка'},
+                                     format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete(self.url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Первая правка')
+
+
+class ImportIngredientsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def import_file(self, suffix, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix,
+                                         encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            stdout, stderr = StringIO(), StringIO()
+            call_command('import_ingredients', file.name, stdout=stdout,
+                         stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def pairs(self):
+        return set(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+    def test_csv_with_duplicates_and_bad_rows(self):
+        stdout, stderr = self.import_file(
+            '.csv',
+            'name,measurement_unit\nсоль,г\nсахар,г\nсахар,г\n'
+            'сахар,кг\nбез единицы\n',
+            batch_size=2,
+        )
+        self.assertEqual(self.pairs(), {('соль', 'г'), ('сахар', 'г'),
+                                        ('сахар', 'кг')})
+        self.assertIn('Добавлено ингредиентов: 2', stdout)
+        self.assertIn('Запись 5', stderr)
+
+    def test_json_fixtures_and_ndjson(self):
+        self.import_file('.json', json.dumps([
+            {'model': 'recipes.tag', 'fields': {'name': 'Завтрак'}},
+            {'model': 'recipes.ingredient',
+             'fields': {'name': 'мука', 'measurement_unit': 'г'}},
+            {'name': 'яйцо', 'measurement_unit': 'шт'},
+        ]))
+        self.import_file('.ndjson', '{"name": "молоко", '
+                                    '"measurement_unit": "мл"}\n')
+        self.assertEqual(self.pairs(), {
+            ('соль', 'г'), ('мука', 'г'), ('яйцо', 'шт'), ('молоко', 'мл'),
+        })
+
+    def test_json_is_read_in_chunks(self):
+        items = [{'name': f'специя {i}', 'measurement_unit': 'г'}
+                 for i in range(200)]
+        with mock.patch('recipes.management.commands.import_ingredients.'
+                        'CHUNK_SIZE', 64):
+            self.import_file('.json', json.dumps(items, ensure_ascii=False))
+        self.assertEqual(Ingredient.objects.count(), 201)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   TRENDING_HALF_LIFE=24 * 60 * 60, TRENDING_LAG=60)
+class TrendingTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='trendy', email='trendy@test.ru', password='pass',
+            first_name='Модный', last_name='Модников',
+        )
+        cls.fans = [
+            User.objects.create_user(username=f'fan{i}',
+                                     email=f'fan{i}@test.ru')
+            for i in range(3)
+        ]
+        cls.classic = create_recipe(cls.author, 'Оливье')
+        cls.fresh = create_recipe(cls.author, 'Смузи')
+        cls.unknown = create_recipe(cls.author, 'Кисель')
+
+    def add_event(self, model, user, recipe, moment):
+        event = model.objects.create(user=user, recipe=recipe)
+        model.objects.filter(pk=event.pk).update(pub_date=moment)
+
+    def names(self, **params):
+        response = self.client.get(reverse('recipes-list'),
+                                   {'ordering': 'trending', **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_scores_decay_and_update_incrementally(self):
+        now = timezone.now()
+        # три события пятидневной давности весят меньше одного свежего
+        for fan in self.fans:
+            self.add_event(Favorites, fan, self.classic,
+                           now - timedelta(days=5))
+        self.add_event(Purchase, self.fans[0], self.fresh,
+                       now - timedelta(hours=1))
+        self.assertEqual(update_trending(now), 4)
+        self.assertEqual(self.names(), ['Смузи', 'Оливье', 'Кисель'])
+        self.assertEqual(self.names(pagination='cursor'),
+                         ['Смузи', 'Оливье', 'Кисель'])
+        # старые строки повторно не читаются: их удаление ключ не меняет
+        Favorites.objects.filter(recipe=self.classic).delete()
+        later = now + timedelta(hours=1)
+        self.add_event(Favorites, self.fans[0], self.classic,
+                       now + timedelta(minutes=30))
+        self.add_event(Purchase, self.fans[1], self.classic,
+                       later - timedelta(seconds=10))
+        self.assertEqual(update_trending(later), 1)
+        self.assertEqual(self.names(), ['Оливье', 'Смузи', 'Кисель'])
+        self.assertEqual(update_trending(later), 0)
+        self.assertEqual(update_trending(later + timedelta(minutes=5)), 1)
+        # пересчет по всей истории уже не видит удаленные строки
+        self.assertEqual(
+            update_trending(later + timedelta(minutes=5), rebuild=True), 3
+        )
+        self.assertEqual(self.names(), ['Оливье', 'Смузи', 'Кисель'])
+        stdout = StringIO()
+        call_command('update_trending', stdout=stdout)
+        self.assertIn('Учтено событий: 0', stdout.getvalue())
+        self.assertEqual(
+            list(TrendingWatermark.objects.values_list('pk', flat=True)), [1]
+        )
+
+    def test_unknown_ordering(self):
+        response = self.client.get(reverse('recipes-list'),
+                                   {'ordering': 'name'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, FEED_FANOUT_LIMIT=1)
+class FeedTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.star, cls.fan = [
+            User.objects.create_user(
+                username=name, email=f'{name}@test.ru', password='pass',
+                first_name=name, last_name=name,
+            )
+            for name in ('reader', 'author', 'star', 'fan')
+        ]
+        cls.salt = Ingredient.objects.create(name='соль',
+                                             measurement_unit='г')
+        cls.old = create_recipe(cls.author, 'Старый рецепт')
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self, user, author, method='get'):
+        client = APIClient()
+        client.force_authenticate(user)
+        return getattr(client, method)(
+            reverse('customuser-subscribe', args=[author.id])
+        )
+
+    def publish(self, author, name):
+        self.client.force_authenticate(author)
+        response = self.client.post(reverse('recipes-list'), {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [],
+            'image': 'data:image/gif;base64,'
+                     + base64.b64encode(SMALL_GIF).decode(),
+            'ingredients': [{'id': self.salt.id, 'amount': 5}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.reader)
+
+    def feed(self, limit=2):
+        names, url = [], reverse('recipes-feed') + f'?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), limit)
+            names += [item['name'] for item in response.data['results']]
+            url = response.data['next']
+        return names
+
+    def test_fan_out_backfill_and_trim(self):
+        self.assertEqual(self.feed(), [])
+        self.subscribe(self.reader, self.author)
+        self.assertEqual(self.feed(), ['Старый рецепт'])
+        self.publish(self.author, 'Новый рецепт')
+        self.publish(self.reader, 'Свой рецепт')
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(),
+                         2)
+        self.assertEqual(self.feed(limit=1),
+                         ['Новый рецепт', 'Старый рецепт'])
+        self.subscribe(self.reader, self.author, 'delete')
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+
+    def test_popular_author_is_merged_on_read(self):
+        self.subscribe(self.reader, self.author)
+        self.subscribe(self.reader, self.star)
+        self.subscribe(self.fan, self.star)
+        self.publish(self.star, 'Звездный рецепт')
+        self.publish(self.author, 'Новый рецепт')
+        self.publish(self.star, 'Второй звездный рецепт')
+        self.star.refresh_from_db()
+        self.assertFalse(self.star.feed_fanout)
+        self.assertFalse(FeedEntry.objects.filter(author=self.star).exists())
+        expected = ['Второй звездный рецепт', 'Новый рецепт',
+                    'Звездный рецепт', 'Старый рецепт']
+        self.assertEqual(self.feed(limit=1), expected)
+        self.assertEqual(self.feed(limit=3), expected)
+        self.assertEqual(self.feed(limit=10), expected)
+
+    def test_errors(self):
+        url = reverse('recipes-feed')
+        for params in ({'limit': 0}, {'limit': 'x'}, {'cursor': 'bad'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+def sequential_scans(queryset):
+    """Таблицы, которые запрос читает целиком, по данным EXPLAIN."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # на маленьких таблицах seq scan дешевле, поэтому он
+            # запрещается: в плане он останется, только если нет индекса
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        return [node['Relation Name'] for node in plan_nodes(plan)
+                if node['Node Type'] == 'Seq Scan']
+    return [line for line in queryset.explain().splitlines()
+            if ' SCAN ' in line and ' USING ' not in line]
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryPlanTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='planner', email='planner@test.ru', password='pass',
+            first_name='План', last_name='Планов',
+        )
+        ingredients = [
+            Ingredient.objects.create(name=f'соус {i}', measurement_unit='г')
+            for i in range(20)
+        ]
+        cls.recipe = create_recipe(
+            cls.author, 'Суп', ingredients=[(ingredients[0], 10)]
+        )
+        for i in range(20):
+            create_recipe(cls.author, f'Рецепт {i}',
+                          ingredients=[(ingredients[i], i + 1)])
+        Purchase.objects.create(user=cls.author, recipe=cls.recipe)
+        Favorites.objects.create(user=cls.author, recipe=cls.recipe)
+
+    def test_hot_lookups_use_indexes(self):
+        queries = {
+            'recipe list': Recipe.objects.all()[:6],
+            'author recipes': Recipe.objects.filter(author=self.author)[:6],
+            'recipe name': Recipe.objects.filter(name='Суп').values('id'),
+            'followers': Follow.objects.filter(
+                author=self.author
+            ).values_list('user', flat=True),
+            'cart users': Purchase.objects.filter(
+                recipe=self.recipe
+            ).values_list('user', flat=True),
+            'favorite users': Favorites.objects.filter(
+                recipe=self.recipe
+            ).values_list('user', flat=True),
+            'recipe ingredients': IngredientForRecipe.objects.filter(
+                recipe=self.recipe
+            ),
+            'trending recipes': Recipe.objects.order_by(
+                '-trending_score', '-id'
+            )[:6],
+            'user feed': FeedEntry.objects.filter(
+                user=self.author
+            ).order_by('-pub_date', '-recipe_id')[:6],
+            'new favorites': Favorites.objects.filter(
+                pub_date__gt=timezone.now() - timedelta(hours=1)
+            ).values_list('recipe_id', 'pub_date'),
+        }
+        if connection.vendor == 'postgresql':
+            # в SQLite LIKE без учета регистра не использует индексы
+            queries['ingredient prefix'] = Ingredient.objects.filter(
+                name__istartswith='соу'
+            )
+        for name, queryset in queries.items():
+            with self.subTest(name):
+                self.assertEqual(sequential_scans(queryset), [])
+
+
+class MetricsTest(APITestCase):
+
+    def test_requests_are_measured_by_url_name(self):
+        Tag.objects.create(name='Полдник', color='#FF00FF', slug='snack')
+        self.client.get(reverse('tags-list'))
+        self.client.get('/api/no-such-page/')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        labels = '{method="GET",status="200",view="tags-list"}'
+        for metric in ('foodgram_request_duration_seconds_count',
+                       'foodgram_request_sql_queries_sum',
+                       'foodgram_request_sql_duration_seconds_count',
+                       'foodgram_response_size_bytes_sum'):
+            self.assertIn(metric + labels, text)
+        self.assertIn('view="unresolved"', text)
+        self.assertNotIn('no-such-page', text)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   SIMILAR_INDEX_DIR=os.path.join(TEMP_MEDIA_ROOT, 'similar'))
+class SeedAndBenchmarkTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_scale', users=20, recipes=60, stdout=StringIO())
+
+    def test_seeded_data_is_consistent(self):
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 60)
+        self.assertTrue(Favorites.objects.exists())
+        self.assertTrue(IngredientForRecipe.objects.exists())
+        call_command('reconcile_counters', check=True, stdout=StringIO())
+        call_command('reconcile_tag_masks', check=True, stdout=StringIO())
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def test_benchmark_and_baseline(self):
+        results = run_benchmark(iterations=2, warmup=0)
+        self.assertIn('recipes-list', results)
+        self.assertEqual(results['recipes-list']['queries'],
+                         RecipeListQueriesTest.LIST_QUERIES)
+        baseline = {name: dict(result, p95_ms=result['p95_ms'] * 10)
+                    for name, result in results.items()}
+        self.assertEqual(compare(results, baseline, 0.25), [])
+        baseline['recipes-list']['queries'] -= 1
+        self.assertEqual(len(compare(results, baseline, 0.25)), 1)
+
+
+def asgi_get(path, query=None, headers=()):
+    """GET через ASGIHandler, как под uvicorn: (статус, тело)."""
+    async def send():
+        communicator = ApplicationCommunicator(get_asgi_application(), {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': urlencode(query or {}).encode(),
+            'headers': [(b'host', b'testserver'), *headers],
+            'server': ('testserver', 80),
+            'client': ('127.0.0.1', 1),
+        })
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(5)
+        body = b''
+        while True:
+            message = await communicator.receive_output(5)
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return start['status'], body
+    return async_to_sync(send)()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class AsgiStreamingTest(TransactionTestCase):
+    # потоковые ответы под ASGI перебираются в цикле событий, а ORM-код
+    # выполняется в других потоках, поэтому данные закоммичены
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username='streamer', email='streamer@test.ru', password='pass'
+        )
+        milk = Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        recipe = create_recipe(user, 'Какао', ingredients=[(milk, 250)])
+        Purchase.objects.create(user=user, recipe=recipe)
+        add_to_shopping_list(user, recipe)
+        self.headers = [
+            (b'authorization',
+             f'Token {Token.objects.create(user=user).key}'.encode()),
+        ]
+
+    def download(self, file_format):
+        return asgi_get(reverse('download_shopping_cart'),
+                        {'file_format': file_format}, self.headers)
+
+    def test_download_txt(self):
+        self.assertEqual(self.download('txt'), (200, 'молоко - 250, мл\n'
+                                                     .encode()))
+
+    def test_download_csv(self):
+        status, content = self.download('csv')
+        self.assertEqual(status, 200)
+        self.assertEqual(content.decode().splitlines()[1:],
+                         ['молоко,250,мл'])
+
+    def test_download_pdf(self):
+        status, content = self.download('pdf')
+        self.assertEqual(status, 200)
+        self.assertTrue(content.startswith(b'%PDF'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   ROOT_URLCONF='foodgram_api.urls_async')
+class AsyncTogglesTest(TransactionTestCase):
+    # ORM-код асинхронных представлений выполняется в других потоках
+    # со своими соединениями, поэтому данные должны быть закоммичены
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='baker', email='baker@test.ru', password='pass'
+        )
+        self.reader = User.objects.create_user(
+            username='eater', email='eater@test.ru', password='pass'
+        )
+        self.recipe = create_recipe(self.author, 'Пирог')
+        self.token = Token.objects.create(user=self.reader).key
+
+    def request(self, method, path, **extra):
+        extra.setdefault('AUTHORIZATION', f'Token {self.token}')
+
+        async def send():
+            return await getattr(self.async_client, method)(path, **extra)
+        return async_to_sync(send)()
+
+    def test_favorite_and_cart_toggles(self):
+        for name, model, counter in (
+            ('recipes-favorite', Favorites, 'favorites_count'),
+            ('shopping_cart', Purchase, 'in_carts_count'),
+        ):
+            path = reverse(name, args=[self.recipe.id])
+            response = self.request('get', path)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()['name'], 'Пирог')
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, counter), 1)
+            self.assertEqual(self.request('get', path).status_code, 400)
+            self.assertEqual(self.request('delete', path).status_code, 204)
+            self.assertFalse(model.objects.exists())
+            self.assertEqual(self.request('delete', path).status_code, 404)
+            self.recipe.refresh_from_db()
+            self.assertEqual(getattr(self.recipe, counter), 0)
+
+    def test_errors_match_sync_views(self):
+        path = reverse('recipes-favorite', args=[self.recipe.id])
+        response = self.request('get', path, AUTHORIZATION='')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = self.request('get', path, AUTHORIZATION='Token wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.request('post', path).status_code, 405)
+        missing = reverse('recipes-favorite', args=[self.recipe.id + 1])
+        self.assertEqual(self.request('get', missing).status_code, 404)
+
+    def test_ingredient_search(self):
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        Ingredient.objects.create(name='молоко', measurement_unit='мл')
+        ingredient_index.build()
+        path = reverse('ingredients-list')
+        response = self.request('get', path + '?' + urlencode(
+            {'name': 'му'}
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['мука'])
+        response = self.request('get', path)
+        self.assertEqual(len(response.json()), 2)
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from .counters import change_counter
+from .models import Favorites, Purchase
+from .serializers import FavoriteSerializer, PurchaseSerializer
+from .shopping_list import add_to_shopping_list
+
+
+def add_favorite(user, recipe):
+    serializer = FavoriteSerializer(
+        data={'user': user.id, 'recipe': recipe.id}
+    )
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        serializer.save(recipe=recipe, user=user)
+        change_counter(recipe, 'favorites_count', 1)
+
+
+def remove_favorite(user, recipe_id):
+    favorite = get_object_or_404(
+        Favorites.objects.select_related('recipe'),
+        user=user, recipe__id=recipe_id
+    )
+    with transaction.atomic():
+        # счетчик избранного уменьшает сигнал post_delete
+        favorite.delete()
+    return favorite
+
+
+def add_to_cart(user, recipe):
+    serializer = PurchaseSerializer(
+        data={'user': user.id, 'recipe': recipe.id}
+    )
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        serializer.save(recipe=recipe, user=user)
+        change_counter(recipe, 'in_carts_count', 1)
+        add_to_shopping_list(user, recipe)
+
+
+def remove_from_cart(user, recipe_id):
+    cart = get_object_or_404(
+        Purchase.objects.select_related('recipe'),
+        user=user, recipe__id=recipe_id
+    )
+    with transaction.atomic():
+        # счетчик корзин и список покупок уменьшает сигнал post_delete
+        cart.delete()
+    return cart
@@ -0,0 +1,91 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Favorites, Purchase, Recipe, TrendingWatermark
+
+# Вес события - 2^(-возраст / TRENDING_HALF_LIFE). Recipe.trending_score
+# хранит сумму весов, приведенную к EPOCH, в log2: затухание со временем
+# одинаково для всех рецептов и порядок не меняет, поэтому пересчитывать
+# нужно только рецепты с новыми событиями. Раньше EPOCH событий нет,
+# так что у рецепта с событиями ключ больше нуля, а ноль - "событий нет".
+EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+TRENDING_ORDERING = ('-trending_score', '-id')
+BATCH_SIZE = 1000
+
+
+def event_key(moment):
+    return (moment - EPOCH).total_seconds() / settings.TRENDING_HALF_LIFE
+
+
+def add_keys(first, second):
+    """log2(2^first + 2^second) без переполнения."""
+    if first < second:
+        first, second = second, first
+    if second == -math.inf:
+        return first
+    return first + math.log2(1 + 2 ** (second - first))
+
+
+def read_events(since, until):
+    """(id рецепта, момент) добавлений в избранное и корзину."""
+    for model in (Favorites, Purchase):
+        events = model.objects.filter(pub_date__lte=until).order_by()
+        if since is not None:
+            events = events.filter(pub_date__gt=since)
+        yield from events.values_list('recipe_id', 'pub_date').iterator()
+
+
+def update_scores(keys):
+    recipe_ids = list(keys)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        scores = Recipe.objects.filter(
+            id__in=recipe_ids[start:start + BATCH_SIZE]
+        ).values_list('id', 'trending_score')
+        Recipe.objects.bulk_update([
+            Recipe(id=recipe_id,
+                   trending_score=add_keys(score or -math.inf,
+                                           keys[recipe_id]))
+            for recipe_id, score in scores
+        ], ['trending_score'])
+
+
+@transaction.atomic
+def update_trending(now=None, rebuild=False):
+    """Добавляет в ключи популярности события после прошлого запуска.
+
+    Читаются только строки избранного и корзин, добавленные после
+    отметки, и обновляются только их рецепты. События последних
+    TRENDING_LAG секунд откладываются до следующего запуска: их
+    транзакции могут быть еще не закоммичены. Удаление из избранного
+    и корзины популярность не уменьшает. С rebuild ключи считаются
+    заново по всей истории. Возвращает число учтенных событий.
+    """
+    until = (now or timezone.now()) - timedelta(
+        seconds=settings.TRENDING_LAG
+    )
+    # отметка всегда в строке pk=1: select_for_update по пустой таблице
+    # ничего не блокирует, и два первых запуска создали бы по строке
+    TrendingWatermark.objects.get_or_create(
+        pk=1, defaults={'processed_until': EPOCH}
+    )
+    watermark = TrendingWatermark.objects.select_for_update().get(pk=1)
+    since = watermark.processed_until
+    if rebuild:
+        Recipe.objects.exclude(trending_score=0).update(trending_score=0)
+        since = None
+    elif since >= until:
+        return 0
+    keys = defaultdict(lambda: -math.inf)
+    events = 0
+    for recipe_id, moment in read_events(since, until):
+        keys[recipe_id] = add_keys(keys[recipe_id], event_key(moment))
+        events += 1
+    update_scores(keys)
+    watermark.processed_until = until
+    watermark.save()
+    return events
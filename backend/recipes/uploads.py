@@ -0,0 +1,60 @@
+import io
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+HEADER_LIMIT = 64 * 1024
+
+ERRORS = {
+    'size': 'Размер картинки превышает {limit} байт',
+    'dimensions': 'Картинка больше {limit}x{limit} пикселей',
+}
+
+
+def check_dimensions(width, height):
+    limit = settings.RECIPE_IMAGE_MAX_DIMENSION
+    if width > limit or height > limit:
+        raise ValidationError(
+            {'image': ERRORS['dimensions'].format(limit=limit)}
+        )
+
+
+def check_size(size):
+    limit = settings.RECIPE_IMAGE_MAX_SIZE
+    if size > limit:
+        raise ValidationError({'image': ERRORS['size'].format(limit=limit)})
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемую картинку во временный файл по частям.
+
+    Размер проверяется на каждом куске, а ширина и высота — как только
+    пришел заголовок картинки, так что слишком большая загрузка
+    прерывается, не дочитываясь до конца.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        check_size(self.received)
+        if self.header is not None:
+            self.header += raw_data
+            self.check_header()
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self):
+        try:
+            with Image.open(io.BytesIO(self.header)) as image:
+                size = image.size
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            if len(self.header) >= HEADER_LIMIT:
+                self.header = None
+            return
+        self.header = None
+        check_dimensions(*size)
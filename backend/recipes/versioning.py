@@ -0,0 +1,32 @@
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Recipe
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'Рецепт уже изменен, загрузите его заново.'
+    default_code = 'precondition_failed'
+
+
+def recipe_etag(recipe):
+    return f'"{recipe.id}-{recipe.version}"'
+
+
+def lock_recipe_version(recipe, request):
+    """Блокирует строку рецепта и проверяет заголовок If-Match.
+
+    Вызывается внутри транзакции до записи: при несовпадении версии
+    бросает PreconditionFailed, иначе увеличивает recipe.version, чтобы
+    параллельная правка с тем же ETag получила 412.
+    """
+    recipe.version = Recipe.objects.select_for_update().values_list(
+        'version', flat=True
+    ).get(pk=recipe.pk)
+    if_match = request.META.get('HTTP_IF_MATCH')
+    if (if_match and if_match.strip() != '*'
+            and recipe_etag(recipe) not in parse_etags(if_match)):
+        raise PreconditionFailed()
+    recipe.version += 1
@@ -1,31 +1,54 @@
 import django_filters.rest_framework
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 from users.serializers import RecipeSubscriptionSerializer
 
+from .bulk import import_recipes
+from .caching import CachedResponseMixin
+from .feed import decode_position, encode_position, get_feed
 from .filters import IngredientNameFilter, RecipeFilter
-from .models import (Favorites, Ingredient, IngredientForRecipe, Purchase,
-                     Recipe, Tag)
+from .ingredient_index import ingredient_index
+from .models import Ingredient, IngredientForRecipe, Recipe, Tag
+from .pagination import RecipeCursorPagination
+from .parsers import NDJSONParser
 from .permissions import AdminOrAuthorOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          PurchaseSerializer, RecipeReadSerializer,
-                          RecipeSerializer, TagSerializer)
+from .relations import get_user_relations
+from .serializers import (IngredientSerializer, PantrySerializer,
+                          RecipeReadSerializer, RecipeSerializer,
+                          TagSerializer)
+from .shopping_list import FORMATS, get_shopping_list
+from .similarity import schedule_similar_update, similar_index
+from .tag_masks import match_mask
+from .toggles import (add_favorite, add_to_cart, remove_favorite,
+                      remove_from_cart)
+from .uploads import RecipeImageUploadHandler
+from .versioning import lock_recipe_version, recipe_etag
 
 User = get_user_model()
 
 
-class TagsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagsViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     permission_classes = (AllowAny,)
+    authentication_classes = ()
     pagination_class = None
+    cache_namespace = 'tags'
 
 
 class RecipesViewSet(viewsets.ModelViewSet):
@@ -35,46 +58,214 @@ class RecipesViewSet(viewsets.ModelViewSet):
     permission_classes = [AdminOrAuthorOrReadOnly, ]
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
+        relations = get_user_relations(self.request)
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredientforrecipe_set',
+                queryset=IngredientForRecipe.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
         is_in_shopping_cart = self.request.query_params.get(
             "is_in_shopping_cart"
         )
         is_favorited = self.request.query_params.get("is_favorited")
-        cart = Purchase.objects.filter(user=self.request.user.id)
-        favorite = Favorites.objects.filter(user=self.request.user.id)
 
         if is_in_shopping_cart == "true":
-            queryset = queryset.filter(purchase__in=cart)
+            queryset = queryset.filter(id__in=list(relations.cart))
         elif is_in_shopping_cart == "false":
-            queryset = queryset.exclude(purchase__in=cart)
+            queryset = queryset.exclude(id__in=list(relations.cart))
         if is_favorited == "true":
-            queryset = queryset.filter(favorites__in=favorite)
-        elif is_favorited == "false":
-            queryset = queryset.exclude(favorites__in=favorite)
-        return queryset.all()
+            return queryset.filter(id__in=list(relations.favorites))
+        if is_favorited == "false":
+            return queryset.exclude(id__in=list(relations.favorites))
+        return queryset
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [RecipeImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            # курсор только у списка: подбор по продуктам листает позиции
+            # в ранжированном массиве номерами страниц
+            if (self.action == 'list' and self.request.query_params.get(
+                    'pagination') == 'cursor'):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self):
         if self.request.method in ['GET']:
             return RecipeReadSerializer
         return RecipeSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        serializer = self.get_serializer(recipe)
+        return Response(serializer.data,
+                        headers={'ETag': recipe_etag(recipe)})
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = self.etag
+        return response
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            lock_recipe_version(serializer.instance, self.request)
+            serializer.save()
+        self.etag = recipe_etag(serializer.instance)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        lock_recipe_version(instance, self.request)
+        schedule_similar_update([instance.id])
+        instance.delete()
+
+    @action(methods=["POST"], detail=False, url_path='bulk',
+            url_name='bulk', permission_classes=[IsAuthenticated],
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        if not isinstance(request.data, list):
+            return Response(
+                {'errors': 'Ожидается список рецептов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        result = import_recipes(request.user, request.data,
+                                settings.RECIPE_BULK_BATCH_SIZE)
+        return Response(
+            result,
+            status=(status.HTTP_201_CREATED if result['created']
+                    else status.HTTP_400_BAD_REQUEST)
+        )
+
+    @action(methods=["GET"], detail=True, url_path='similar',
+            url_name='similar', pagination_class=None)
+    def similar(self, request, pk):
+        if not pk.isdigit():
+            raise Http404
+        limit = request.query_params.get('limit')
+        if limit is None:
+            limit = settings.SIMILAR_RECIPES_LIMIT
+        elif limit.isdigit():
+            limit = min(int(limit), settings.SIMILAR_RECIPES_MAX_LIMIT)
+        else:
+            raise ValidationError(
+                {'limit': 'Укажите целое неотрицательное число'}
+            )
+        similar = similar_index.similar(int(pk), limit)
+        if similar is None:
+            # рецепт мог появиться после сборки индекса
+            get_object_or_404(Recipe, id=pk)
+            similar = []
+        recipes = Recipe.objects.in_bulk(
+            [recipe_id for recipe_id, _ in similar]
+        )
+        return Response([
+            {**RecipeSubscriptionSerializer(recipes[recipe_id]).data,
+             'similarity': round(score, 4)}
+            for recipe_id, score in similar if recipe_id in recipes
+        ])
+
+    @action(methods=["GET"], detail=False, url_path='feed',
+            url_name='feed', permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов из подписок, постранично по курсору."""
+        limit = request.query_params.get('limit')
+        if limit is None:
+            limit = api_settings.PAGE_SIZE
+        elif limit.isdigit() and int(limit) > 0:
+            limit = min(int(limit), settings.FEED_MAX_LIMIT)
+        else:
+            raise ValidationError(
+                {'limit': 'Укажите целое положительное число'}
+            )
+        position = None
+        cursor = request.query_params.get('cursor')
+        if cursor is not None:
+            position = decode_position(cursor)
+            if position is None:
+                raise ValidationError({'cursor': 'Неверный курсор'})
+        items = get_feed(request.user, limit, position)
+        page = items[:limit]
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in page]
+        )
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id in page
+             if recipe_id in recipes],
+            many=True
+        )
+        next_link = None
+        if len(items) > limit:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor',
+                encode_position(page[-1])
+            )
+        return Response({'next': next_link, 'results': serializer.data})
+
+    @action(methods=["POST"], detail=False, url_path='pantry',
+            url_name='pantry', permission_classes=[AllowAny])
+    def pantry(self, request):
+        """Рецепты из имеющихся продуктов по индексу ингредиентов.
+
+        Теги фильтруются теми же параметрами tags и tags_match, что
+        и в списке рецептов.
+        """
+        serializer = PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        filterset = RecipeFilter(request.query_params)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        tags = filterset.form.cleaned_data.get('tags')
+        match_all = filterset.form.cleaned_data.get('tags_match') == 'all'
+        mask = match_mask(tags, match_all) if tags else 0
+        ingredients = serializer.validated_data['ingredients']
+        if mask is None:
+            ingredients = []
+        # ранжируются только рецепты до конца запрошенной страницы
+        page_number = request.query_params.get(
+            self.paginator.page_query_param, '1'
+        )
+        limit = None
+        if page_number.isdigit():
+            limit = self.paginator.get_page_size(request) * int(page_number)
+        recipe_ids, coverage, missing, count = similar_index.pantry(
+            ingredients, mask, match_all, limit
+        )
+        recipe_ids = recipe_ids.tolist()
+        # страница - позиции в ранжированных массивах
+        page = self.paginate_queryset(range(count))
+        recipes = Recipe.objects.in_bulk(
+            [recipe_ids[position] for position in page]
+        )
+        data = []
+        for position in page:
+            recipe = recipes.get(recipe_ids[position])
+            # рецепт могли удалить до обновления индекса
+            if recipe is not None:
+                data.append({
+                    **RecipeSubscriptionSerializer(recipe).data,
+                    'coverage': round(float(coverage[position]), 4),
+                    'missing': int(missing[position]),
+                })
+        return self.get_paginated_response(data)
+
     @action(methods=["GET", "DELETE"],
             url_path='favorite', url_name='favorite',
             permission_classes=[permissions.IsAuthenticated], detail=True)
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        serializer = FavoriteSerializer(
-            data={'user': request.user.id, 'recipe': recipe.id}
-        )
         if request.method == "GET":
-            serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=request.user)
+            recipe = get_object_or_404(Recipe, id=pk)
+            add_favorite(request.user, recipe)
             serializer = RecipeSubscriptionSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        favorite = get_object_or_404(
-            Favorites, user=request.user, recipe__id=pk
-        )
-        favorite.delete()
+        favorite = remove_favorite(request.user, pk)
         return Response(
             data={
                 'message': f'Рецепт {favorite.recipe} удален из избранного у '
@@ -83,44 +274,44 @@ class RecipesViewSet(viewsets.ModelViewSet):
         )
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny, )
+    authentication_classes = ()
     pagination_class = None
     filterset_class = IngredientNameFilter
+    cache_namespace = 'ingredients'
+    cache_query_params = ('name', 'measurement_unit')
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name or 'measurement_unit' in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(
+            name, settings.INGREDIENT_SEARCH_LIMIT
+        ))
 
 
 @api_view(['GET', ])
 @permission_classes([IsAuthenticated])
 def download_shopping_cart(request):
-    user = request.user
-    ingredients_in_recipe = IngredientForRecipe.objects.filter(
-        recipe__purchase__user=user
-    )
-    buying_list = {}
-    for item in ingredients_in_recipe:
-        amount = item.amount
-        name = item.ingredient.name
-        measurement_unit = item.ingredient.measurement_unit
-        if name not in buying_list:
-            buying_list[name] = {
-                'amount': amount,
-                'measurement_unit': measurement_unit
-            }
-        else:
-            buying_list[name]['amount'] = (
-                buying_list[name]['amount'] + amount
-            )
-    shopping_list = []
-    for item in buying_list:
-        shopping_list.append(
-            f'{item} - {buying_list[item]["amount"]}, '
-            f'{buying_list[item]["measurement_unit"]}\n'
+    file_format = request.query_params.get('file_format', 'txt')
+    if file_format not in FORMATS:
+        return Response(
+            data={'errors': f'Неподдерживаемый формат: {file_format}. '
+                            f'Доступны: {", ".join(FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-    response = HttpResponse(shopping_list, 'Content-Type: text/plain')
+    render, content_type = FORMATS[file_format]
+    # строки читаются здесь: под ASGI тело ответа перебирается в цикле
+    # событий, где обращаться к ORM нельзя
+    shopping_list = list(get_shopping_list(request.user))
+    response = StreamingHttpResponse(
+        render(shopping_list), content_type=content_type
+    )
     response['Content-Disposition'] = (
-        'attachment;' 'filename="shopping_list.txt"'
+        f'attachment; filename="shopping_list.{file_format}"'
     )
     return response
 
@@ -130,24 +321,16 @@ class ShoppingCartView(APIView):
     http_method_names = ['get', 'delete']
 
     def get(self, request, recipe_id):
-        user = request.user
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        serializer = PurchaseSerializer(
-            data={'user': user.id, 'recipe': recipe.id},
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save(recipe=recipe, user=request.user)
+        add_to_cart(request.user, recipe)
         serializer = RecipeSubscriptionSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, recipe_id):
-        user = request.user
-        cart = get_object_or_404(Purchase, user=user, recipe__id=recipe_id)
-        cart.delete()
+        cart = remove_from_cart(request.user, recipe_id)
         return Response(
             data={
                 'message': f'Рецепт {cart.recipe} удален из корзины у '
-                           f'пользователя {user}'},
+                           f'пользователя {request.user}'},
             status=status.HTTP_204_NO_CONTENT
         )
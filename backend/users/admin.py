@@ -7,7 +7,9 @@ User = get_user_model()
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'email', 'username', 'first_name', 'last_name')
+    list_display = ('id', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
+    readonly_fields = ('recipes_count', 'followers_count', 'feed_fanout')
     list_filter = ('email', 'username')
 
 
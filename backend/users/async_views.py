@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
+from foodgram_api.async_api import async_api_view, in_thread
+from rest_framework import status
+from rest_framework.response import Response
+
+from .serializers import ShowFollowsSerializer
+from .toggles import follow, unfollow
+from .views import get_latest_recipes, parse_recipes_limit
+
+User = get_user_model()
+
+
+def serialize_follow(request, author, recipes):
+    # is_subscribed читает связи пользователя из кэша или базы
+    return ShowFollowsSerializer(
+        author, context={'request': request, 'recipes': recipes}
+    ).data
+
+
+@async_api_view(['GET', 'DELETE'])
+async def subscribe(request, id):
+    author = await in_thread(get_object_or_404, User, id=id)
+    if request.method == 'GET':
+        limit = parse_recipes_limit(request.GET)
+        recipes = await in_thread(get_latest_recipes, [author.id], limit)
+        await in_thread(follow, request.user, author)
+        data = await in_thread(serialize_follow, request, author, recipes)
+        return Response(data, status=status.HTTP_201_CREATED)
+    await in_thread(unfollow, request.user, author)
+    return Response(data={'message': f'{request.user} отписался от '
+                                     f'{author}'},
+                    status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,77 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.crypto import salted_hmac
+from rest_framework.authentication import TokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+User = get_user_model()
+
+# поля пользователя, которые кладутся в JWT: права проверяются по ним
+# без отложенной загрузки
+USER_CLAIMS = ('username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def auth_stamp(user):
+    """Отметка для JWT: меняется при смене пароля и при выходе."""
+    return salted_hmac(
+        'users.auth_stamp', f'{user.password}:{user.logout_count}'
+    ).hexdigest()
+
+
+def token_cache_key(key):
+    # сам токен в ключ кеша не попадает
+    return 'auth_token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def forget_tokens(keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кешем токен -> пользователь.
+
+    Пара (пользователь, токен) хранится AUTH_TOKEN_CACHE_TIMEOUT секунд
+    и удаляется сигналами при выходе и при сохранении пользователя,
+    например после смены пароля. С локальным кешем другие процессы
+    узнают об этом только по истечении таймаута.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials,
+                      settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return credentials
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWT-аутентификация без обращения к базе.
+
+    Пользователь собирается из claims токена: загружены только id
+    и поля из USER_CLAIMS, остальные отложены, как после .only(),
+    и читаются из базы при первом обращении. save() такого пользователя
+    записывает только загруженные поля. Выход, смена пароля
+    и блокировка отзывают refresh-токены, а уже выданный access-токен
+    действует до истечения.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken('В токене нет идентификатора пользователя')
+        values = {api_settings.USER_ID_FIELD:
+                  validated_token[api_settings.USER_ID_CLAIM]}
+        for claim in USER_CLAIMS:
+            if claim in validated_token:
+                values[claim] = validated_token[claim]
+        fields = [field.attname for field in User._meta.concrete_fields
+                  if field.attname in values]
+        return User.from_db(router.db_for_read(User), fields,
+                            [values[field] for field in fields])
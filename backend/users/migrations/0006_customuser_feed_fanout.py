@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_follow_author_user_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='feed_fanout',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Рассылка рецептов в ленты подписчиков'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_customuser_feed_fanout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='logout_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Выходов из системы'),
+        ),
+    ]
@@ -23,6 +23,23 @@ class CustomUser(AbstractUser):
         unique=True,
         max_length=254
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Подписчиков'
+    )
+    # выключается навсегда, когда подписчиков больше FEED_FANOUT_LIMIT;
+    # ленты подписчиков тогда берут рецепты автора при чтении
+    feed_fanout = models.BooleanField(
+        default=True, editable=False,
+        verbose_name='Рассылка рецептов в ленты подписчиков'
+    )
+    # входит в отметку auth_stamp в JWT: выход из системы отзывает
+    # выданные refresh-токены
+    logout_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Выходов из системы'
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -39,7 +56,7 @@ class Follow(models.Model):
         related_name='followers',
         verbose_name='Пользователь подписчик')
     author = models.ForeignKey(
-        CustomUser, on_delete=models.CASCADE,
+        CustomUser, on_delete=models.CASCADE, db_index=False,
         related_name='following',
         verbose_name='Пользователь на которого подписываемся')
     created_at = models.DateTimeField(
@@ -54,6 +71,10 @@ class Follow(models.Model):
                 fields=['user', 'author'], name='unique_follow'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
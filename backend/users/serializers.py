@@ -1,8 +1,16 @@
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
+from recipes.fields import ImageDerivativesField
 from recipes.models import Recipe
+from recipes.relations import get_user_relations
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from .authentication import USER_CLAIMS, auth_stamp
 from .models import Follow
 
 User = get_user_model()
@@ -17,21 +25,59 @@ class CustomUserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=request.user, author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        relations = get_user_relations(self.context.get('request'))
+        return obj.id in relations.following
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Пара JWT с полями USER_CLAIMS для StatelessJWTAuthentication.
+
+    auth_stamp проверяется при обновлении access-токена.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token['auth_stamp'] = auth_stamp(user)
+        return token
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление access-токена только для действующего пользователя.
+
+    Refresh-токен отклоняется, если пользователь заблокирован, сменил
+    пароль или вышел из системы после его выдачи.
+    """
+
+    def validate(self, attrs):
+        # недействительный токен TokenRefreshView превращает в 401
+        refresh = RefreshToken(attrs['refresh'])
+        user = User.objects.filter(**{
+            jwt_settings.USER_ID_FIELD: refresh.get(
+                jwt_settings.USER_ID_CLAIM
+            )
+        }).first()
+        if (user is None or not user.is_active
+                or refresh.get('auth_stamp') != auth_stamp(user)):
+            raise InvalidToken('Токен отозван')
+        return super().validate(attrs)
 
 
 class RecipeSubscriptionSerializer(serializers.ModelSerializer):
+    images = ImageDerivativesField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ["id", "name", "image", "cooking_time"]
+        fields = ["id", "name", "image", "images", "cooking_time"]
 
 
 class ShowFollowsSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -39,13 +85,11 @@ class ShowFollowsSerializer(CustomUserSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        recipes = Recipe.objects.filter(author=obj)
+        recipes = self.context.get('recipes', {}).get(obj.id)
+        if recipes is None:
+            recipes = Recipe.objects.filter(author=obj)
         return RecipeSubscriptionSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        queryset = Recipe.objects.filter(author=obj)
-        return queryset.count()
-
 
 class FollowSerializer(serializers.ModelSerializer):
     user = serializers.IntegerField(source='user.id')
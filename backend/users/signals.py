@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model, user_logged_out
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # вход обновляет только last_login, кеш при этом не устаревает
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    forget_tokens(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
+
+
+@receiver(user_logged_out, sender=User)
+def revoke_refresh_tokens(sender, user, **kwargs):
+    # меняет auth_stamp: выданные refresh-токены больше не обновляются
+    User.objects.filter(pk=user.pk).update(
+        logout_count=F('logout_count') + 1
+    )
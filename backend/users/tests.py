@@ -1,3 +1,256 @@
-from django.test import TestCase
+import base64
+import shutil
+import tempfile
+from io import StringIO
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from .authentication import (CachedTokenAuthentication,
+                             StatelessJWTAuthentication, token_cache_key)
+from .models import Follow
+
+User = get_user_model()
+
+SMALL_GIF = base64.b64decode(
+    'R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw=='
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@test.ru', password='pass',
+        first_name='Имя', last_name='Фамилия',
+    )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SubscriptionsTest(APITestCase):
+    # count, authors with recipes_count, recipe previews
+    SUBSCRIPTIONS_QUERIES = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('follower')
+        cls.authors = [create_user(f'author{i}') for i in range(4)]
+        for number, author in enumerate(cls.authors):
+            Follow.objects.create(user=cls.user, author=author)
+            for i in range(number + 2):
+                Recipe.objects.create(
+                    author=author, name=f'{author.username} {i}',
+                    text='Описание', cooking_time=5,
+                    image=ContentFile(SMALL_GIF, name='small.gif'),
+                )
+        call_command('reconcile_counters', stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.url = reverse('customuser-subscriptions')
+
+    def test_recipes_limit_and_counts(self):
+        with self.assertNumQueries(self.SUBSCRIPTIONS_QUERIES):
+            response = self.client.get(self.url, {'recipes_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        for item in response.data['results']:
+            author = User.objects.get(id=item['id'])
+            latest = list(
+                Recipe.objects.filter(author=author).values_list(
+                    'id', flat=True
+                )[:2]
+            )
+            self.assertEqual(
+                [recipe['id'] for recipe in item['recipes']], latest
+            )
+            self.assertEqual(item['recipes_count'],
+                             author.recipes.count())
+            self.assertTrue(item['is_subscribed'])
+
+    def test_without_limit_returns_all_recipes(self):
+        response = self.client.get(self.url)
+        for item in response.data['results']:
+            self.assertEqual(len(item['recipes']), item['recipes_count'])
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.get(self.url, {'recipes_limit': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_subscribe_response(self):
+        author = create_user('newauthor')
+        response = self.client.get(
+            reverse('customuser-subscribe', args=[author.id]),
+            {'recipes_limit': 1}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes'], [])
+        self.assertEqual(response.data['recipes_count'], 0)
+
+    def test_followers_count(self):
+        author = self.authors[0]
+        other = create_user('other')
+        self.client.force_authenticate(other)
+        url = reverse('customuser-subscribe', args=[author.id])
+        self.client.get(url)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 2)
+        self.client.delete(url)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   ROOT_URLCONF='foodgram_api.urls_async')
+class AsyncSubscribeTest(TransactionTestCase):
+
+    def setUp(self):
+        self.user = create_user('follower')
+        self.author = create_user('author')
+        for i in range(3):
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {i}', text='Описание',
+                cooking_time=5,
+                image=ContentFile(SMALL_GIF, name='small.gif'),
+            )
+        call_command('reconcile_counters', stdout=StringIO())
+        self.token = Token.objects.create(user=self.user).key
+        self.url = reverse('customuser-subscribe', args=[self.author.id])
+
+    def request(self, method, path):
+        async def send():
+            return await getattr(self.async_client, method)(
+                path, AUTHORIZATION=f'Token {self.token}'
+            )
+        return async_to_sync(send)()
+
+    def test_subscribe_and_unsubscribe(self):
+        response = self.request(
+            'get', self.url + '?' + urlencode({'recipes_limit': 2})
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertTrue(data['is_subscribed'])
+        self.assertEqual(len(data['recipes']), 2)
+        self.assertEqual(data['recipes_count'], 3)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.request('get', self.url).status_code, 400)
+        self.assertEqual(self.request('delete', self.url).status_code, 204)
+        self.assertFalse(Follow.objects.exists())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_invalid_recipes_limit(self):
+        response = self.request('get', self.url + '?recipes_limit=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('recipes_limit', response.json())
+
+
+class AuthenticationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('reader')
+        self.author = create_user('writer')
+
+    def obtain(self, url_name):
+        response = self.client.post(reverse(url_name), {
+            'email': self.user.email, 'password': 'pass'
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_token_is_cached_until_logout(self):
+        key = self.obtain('login')['auth_token']
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(key)
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(key)
+        self.assertEqual((user, token.key), (self.user, key))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        response = self.client.post(reverse('customuser-set-password'), {
+            'current_password': 'pass', 'new_password': 'Nov0e-parol',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(token_cache_key(key)))
+        self.assertEqual(self.client.get(reverse('customuser-me')).status_code,
+                         200)
+        self.assertIsNotNone(cache.get(token_cache_key(key)))
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 204)
+        self.assertEqual(self.client.get(reverse('customuser-me')).status_code,
+                         401)
+
+    def test_jwt_is_checked_without_database(self):
+        tokens = self.obtain('jwt-create')
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}'
+        )
+        with self.assertNumQueries(0):
+            user, _ = StatelessJWTAuthentication().authenticate(request)
+            self.assertEqual((user.id, user.username),
+                             (self.user.id, 'reader'))
+            self.assertEqual(
+                (user.is_active, user.is_staff, user.is_superuser),
+                (True, False, False),
+            )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}'
+        )
+        response = self.client.get(reverse('customuser-me'))
+        self.assertEqual(response.data['email'], self.user.email)
+        response = self.client.get(
+            reverse('customuser-subscribe', args=[self.author.id])
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Follow.objects.filter(
+            user=self.user, author=self.author
+        ).exists())
+        response = self.client.post(reverse('customuser-set-password'), {
+            'current_password': 'pass', 'new_password': 'Nov0e-parol',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Nov0e-parol'))
+        self.assertEqual(self.user.first_name, 'Имя')
+        # после смены пароля refresh-токен больше не обновляется
+        response = self.client.post(reverse('jwt-refresh'),
+                                    {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer broken')
+        self.assertEqual(self.client.get(reverse('customuser-me')).status_code,
+                         401)
+
+    def refresh(self, tokens):
+        return self.client.post(reverse('jwt-refresh'),
+                                {'refresh': tokens['refresh']})
+
+    def test_refresh_is_revoked_by_logout_and_blocking(self):
+        tokens = self.obtain('jwt-create')
+        self.assertEqual(self.refresh(tokens).status_code, 200)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}'
+        )
+        self.assertEqual(self.client.post(reverse('logout')).status_code,
+                         204)
+        self.client.credentials()
+        self.assertEqual(self.refresh(tokens).status_code, 401)
+        tokens = self.obtain('jwt-create')
+        self.assertEqual(self.refresh(tokens).status_code, 200)
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.refresh(tokens).status_code, 401)
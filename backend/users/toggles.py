@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from recipes.counters import change_counter
+from recipes.feed import backfill, trim
+
+from .models import Follow
+from .serializers import FollowSerializer
+
+
+def follow(user, author):
+    serializer = FollowSerializer(
+        data={'user': user.id, 'author': author.id}
+    )
+    serializer.is_valid(raise_exception=True)
+    with transaction.atomic():
+        serializer.save(user=user)
+        change_counter(author, 'followers_count', 1)
+        backfill(user, author)
+
+
+def unfollow(user, author):
+    follow = get_object_or_404(Follow, user=user, author=author)
+    with transaction.atomic():
+        # счетчик подписчиков уменьшает сигнал post_delete
+        follow.delete()
+        trim(user, author)
+    return follow
@@ -1,6 +1,10 @@
-from django.urls import include, re_path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import (TokenObtainPairView,
+                                            TokenRefreshView, TokenVerifyView)
 
+from .serializers import (UserTokenObtainPairSerializer,
+                          UserTokenRefreshSerializer)
 from .views import CustomUserViewSet
 
 router = DefaultRouter()
@@ -9,4 +13,11 @@ router.register('users', CustomUserViewSet)
 urlpatterns = [
     re_path(r'^', include(router.urls)),
     re_path(r'^auth/', include('djoser.urls.authtoken')),
+    path('auth/jwt/create/', TokenObtainPairView.as_view(
+        serializer_class=UserTokenObtainPairSerializer
+    ), name='jwt-create'),
+    path('auth/jwt/refresh/', TokenRefreshView.as_view(
+        serializer_class=UserTokenRefreshSerializer
+    ), name='jwt-refresh'),
+    path('auth/jwt/verify/', TokenVerifyView.as_view(), name='jwt-verify'),
 ]
@@ -1,19 +1,77 @@
 from django.contrib.auth import get_user_model
+from django.db.models import BooleanField, F, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
+from recipes.models import Recipe
 from rest_framework import permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
-from .models import Follow
-from .serializers import FollowSerializer, ShowFollowsSerializer
+from .serializers import ShowFollowsSerializer
+from .toggles import follow, unfollow
 
 User = get_user_model()
 
 
+def get_latest_recipes(author_ids, limit=None):
+    """Последние рецепты авторов одним запросом: {id автора: [рецепты]}.
+
+    При заданном limit у каждого автора остается не больше limit
+    рецептов, отобранных оконной функцией ROW_NUMBER().
+    """
+    recipes = Recipe.objects.filter(author__in=author_ids)
+    if limit is not None:
+        ranked = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        )).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE row_number <= %s',
+            params + (limit,)
+        ))
+    result = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        result[recipe.author_id].append(recipe)
+    return result
+
+
+def parse_recipes_limit(query_params):
+    recipes_limit = query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    if not recipes_limit.isdigit():
+        raise ValidationError(
+            {'recipes_limit': 'Укажите целое неотрицательное число'}
+        )
+    return int(recipes_limit)
+
+
 class CustomUserViewSet(UserViewSet):
 
+    def get_instance(self):
+        # пользователь из JWT загружен не полностью, остальные поля
+        # читаются одним запросом, а не по одному на поле
+        user = self.request.user
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user
+
+    def get_follows_context(self, authors):
+        return {
+            'request': self.request,
+            'recipes': get_latest_recipes(
+                [author.id for author in authors],
+                parse_recipes_limit(self.request.query_params)
+            ),
+        }
+
     @action(detail=True,
             methods=["GET", "DELETE"],
             url_path='subscribe',
@@ -21,18 +79,14 @@ class CustomUserViewSet(UserViewSet):
             permission_classes=[permissions.IsAuthenticated])
     def subscribe(self, request, id):
         author = get_object_or_404(User, id=id)
-        serializer = FollowSerializer(
-            data={'user': request.user.id, 'author': id}
-        )
         if request.method == "GET":
-            serializer.is_valid(raise_exception=True)
-            serializer.save(user=request.user)
-            serializer = ShowFollowsSerializer(author)
+            context = self.get_follows_context([author])
+            follow(request.user, author)
+            serializer = ShowFollowsSerializer(author, context=context)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        follow = get_object_or_404(Follow, user=request.user, author__id=id)
-        follow.delete()
+        unfollow(request.user, author)
         return Response(data={'message': f'{request.user} отписался от '
-                                         f'{follow.author}'},
+                                         f'{author}'},
                         status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False,
@@ -41,10 +95,16 @@ class CustomUserViewSet(UserViewSet):
             url_name='subscriptions',
             permission_classes=[permissions.IsAuthenticated])
     def show_follows(self, request):
-        user_obj = User.objects.filter(following__user=request.user)
+        user_obj = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
         paginator = PageNumberPagination()
         paginator.page_size = 6
         result_page = paginator.paginate_queryset(user_obj, request)
         serializer = ShowFollowsSerializer(
-            result_page, many=True, context={'current_user': request.user})
+            result_page, many=True,
+            context=self.get_follows_context(result_page)
+        )
         return paginator.get_paginated_response(serializer.data)